@@ -1,8 +1,29 @@
-from airflow import DAG
-from airflow.operators.bash import BashOperator
-from airflow.utils.dates import days_ago
+import os
+import sys
 from datetime import timedelta
 
+from airflow.decorators import dag, task
+from airflow.utils.dates import days_ago
+
+# Only Airflow is imported at parse time. Every task imports its script inside the
+# task body, so the scheduler never loads pandas, pyarrow, boto3 or matplotlib
+# while parsing this file, and each task pays only for the libraries it uses.
+SCRIPTS_DIR = os.getenv("PIPELINE_SCRIPTS_DIR", "/opt/airflow/scripts")
+
+# Fire download tasks running at once (one mapped task per year). They share the
+# FIRMS quota of a single MAP_KEY, so each gets 1/N of FIRMS_REQUESTS_PER_MINUTE.
+FIRE_FETCH_PARALLELISM = int(os.getenv("FIRE_FETCH_PARALLELISM", "4"))
+
+# GOLD_ENGINE=duckdb|arrow builds the gold summary straight from the bronze files,
+# so the transform no longer waits for the Postgres load (see scripts/gold_engine.py)
+GOLD_ENGINE = os.getenv("GOLD_ENGINE", "postgres").lower()
+GOLD_FROM_BRONZE = GOLD_ENGINE in ("duckdb", "arrow")
+
+# Charts drawn from the Postgres fire rollups rather than the gold summary
+# (same CHART_NAMES setting as scripts/visualize_trends.py)
+CHART_NAMES = {c.strip() for c in os.getenv("CHART_NAMES", "global,zones,monthly").split(",") if c.strip()}
+ROLLUP_CHARTS = CHART_NAMES & {"zones", "monthly"}
+
 # DAG Configuration
 default_args = {
     'owner': 'airflow',
@@ -13,58 +34,169 @@ default_args = {
     'retry_delay': timedelta(minutes=5),
 }
 
-# Define the DAG
-with DAG(
-    'wildfire_climate_pipeline',
+
+def use_pipeline_scripts():
+    """Makes /opt/airflow/scripts importable (the scripts import each other by name)."""
+    if SCRIPTS_DIR not in sys.path:
+        sys.path.insert(0, SCRIPTS_DIR)
+
+
+def stage_metadata(summary, **extra):
+    """Small XCom payload: what the task produced plus its timing from instrumentation."""
+    return {**extra, "seconds": summary["seconds"],
+            "peak_memory_mb": round(summary["peak_memory_bytes"] / 1024 / 1024, 1),
+            "counters": summary["counters"]}
+
+
+@dag(
+    dag_id='wildfire_climate_pipeline',
     default_args=default_args,
     description='A pipeline to analyze the relationship between global warming and wildfire frequency.',
     schedule_interval='@yearly',
     start_date=days_ago(1),
     catchup=False,
-    tags=['wildfire', 'climate', 'analysis','elt'],
-) as dag:
-
-    # Task 1: fetch_temperature 
-    t1_fetch_temps = BashOperator(
-        task_id='fetch_temperature',
-        bash_command='python /opt/airflow/scripts/fetch_temperature.py'
-    )
-
-    # Task 2: fetch_wildfires_raw
-    t2_fetch_fires = BashOperator(
-        task_id='fetch_wildfires_raw',
-        bash_command='python /opt/airflow/scripts/fetch_wildfires_raw.py'
-    )
-
-    # --- TASK 3: Upload to AWS S3 (The New Step) ---
-    t3_upload_s3 = BashOperator(
-        task_id='upload_to_aws',
-        bash_command='python /opt/airflow/scripts/upload_to_s3.py',
-    )
-
-    # TASK 4: Load to Postgres
-    t4_load_db = BashOperator(
-        task_id='load_to_postgres',
-        bash_command='python /opt/airflow/scripts/load_to_postgres.py',
-    )
-
-    # TASK 5: Transform (SQL) 
-    t5_transform = BashOperator(
-        task_id='transform_gold_layer',
-        bash_command='python /opt/airflow/scripts/transform_data.py',
-    )
-
-    # TASK 6: Visualize 
-    t6_visualize = BashOperator(
-        task_id='generate_chart',
-        bash_command='python /opt/airflow/scripts/visualize_trends.py',
-    )
+    tags=['wildfire', 'climate', 'analysis', 'elt'],
+)
+def wildfire_climate_pipeline():
+
+    # Task 1: fetch_temperature
+    @task
+    def fetch_temperature():
+        use_pipeline_scripts()
+        from fetch_temperature import CLEAN_FILE, SERIES_FILE, fetch_temperature_data
+        from instrumentation import run_stage
+
+        with run_stage("fetch_temperature") as summary:
+            points = fetch_temperature_data()
+        return stage_metadata(summary, path=CLEAN_FILE, series_path=SERIES_FILE, rows=len(points))
+
+    # Task 2a: which years still have days missing from bronze
+    @task
+    def plan_fire_batches():
+        use_pipeline_scripts()
+        from fetch_fire_raw import plan_year_batches
+
+        batches = plan_year_batches()
+        print(f"{len(batches)} years to fetch: {[b['start'][:4] for b in batches]}")
+        return batches
+
+    # Task 2b: one mapped task per year, run in parallel by the LocalExecutor
+    @task(max_active_tis_per_dag=FIRE_FETCH_PARALLELISM)
+    def fetch_fire_batch(batch):
+        use_pipeline_scripts()
+        from fetch_fire_raw import fetch_raw_fire_data
+        from firms_client import REQUESTS_PER_MINUTE
+        from instrumentation import run_stage
+
+        with run_stage(f"fetch_fire_raw_{batch['start'][:4]}") as summary:
+            result = fetch_raw_fire_data(batch["start"], batch["end"],
+                                         requests_per_minute=REQUESTS_PER_MINUTE / FIRE_FETCH_PARALLELISM)
+        return stage_metadata(summary, **batch, **result)
+
+    # Task 3: Upload to AWS S3. A year with nothing to fetch is a skipped mapped
+    # task, which must not skip everything downstream, hence none_failed.
+    @task(trigger_rule='none_failed')
+    def upload_to_aws():
+        use_pipeline_scripts()
+        from instrumentation import run_stage
+        from upload_to_s3 import upload_directory_to_s3
+
+        with run_stage("upload_to_s3") as summary:
+            result = upload_directory_to_s3()
+        return stage_metadata(summary, **result)
+
+    # Task 4: Load to Postgres
+    @task(trigger_rule='none_failed')
+    def load_to_postgres(temperatures):
+        use_pipeline_scripts()
+        from instrumentation import run_stage
+        from load_to_postgres import load_data
+
+        print(f"Fetched {temperatures['rows']} temperature rows ({temperatures['path']})")
+        with run_stage("load_to_postgres") as summary:
+            result = load_data()
+        return stage_metadata(summary, **result)
+
+    # Task 5: Transform (SQL, or DuckDB/Arrow over bronze). The annual summary itself
+    # (~25 rows) goes to XCom.
+    @task(trigger_rule='none_failed')
+    def transform_gold_layer(loaded=None):
+        use_pipeline_scripts()
+        from instrumentation import run_stage
+        from transform_data import run_transformation
+
+        if loaded:
+            print(f"Loaded {loaded['fire_rows']} new fire rows, {loaded['temperature_rows']} temperature rows, "
+                  f"{loaded.get('climate_rows', 0)} changed climate months")
+        with run_stage("transform_data") as summary:
+            result = run_transformation(engine=GOLD_ENGINE)
+        return stage_metadata(summary, **result)
+
+    # Task 5b: with a local gold engine the transform skips Postgres, so the fire
+    # rollups (and the climate stats built on them) are refreshed here once the
+    # load has marked its dirty ranges
+    @task(trigger_rule='none_failed')
+    def refresh_fire_rollups(loaded):
+        use_pipeline_scripts()
+        from instrumentation import run_stage
+        from transform_data import refresh_rollups
+
+        print(f"Loaded {loaded['fire_rows']} new fire rows")
+        with run_stage("refresh_rollups") as summary:
+            result = refresh_rollups()
+        return stage_metadata(summary, **result)
+
+    # Task 6: Visualize straight from the XCom rows (the gold CSV is not read back).
+    # Charts whose inputs did not change since the last run are not redrawn.
+    @task
+    def generate_chart(gold):
+        use_pipeline_scripts()
+        from instrumentation import run_stage
+        from visualize_trends import render_charts
+
+        with run_stage("visualize_trends") as summary:
+            paths = render_charts(gold["rows"])
+        return stage_metadata(summary, paths=paths)
+
+    # Task 7: Bronze lifecycle, once every reader of this run is done: small files
+    # compacted (S3 rewritten to match), the oldest files already in S3 evicted
+    # down to the local budget (see scripts/bronze_lifecycle.py)
+    @task(trigger_rule='none_failed')
+    def manage_bronze_lifecycle():
+        use_pipeline_scripts()
+        from bronze_lifecycle import run_lifecycle
+        from instrumentation import run_stage
+
+        with run_stage("bronze_lifecycle") as summary:
+            result = run_lifecycle()
+        return stage_metadata(summary, **result)
 
     # Define Task Dependencies
+    # Temperatures and the per-year fire downloads run in parallel; upload and load
+    # both only need the bronze files, so they run side by side as well
+    temperatures = fetch_temperature()
+    fire_batches = fetch_fire_batch.expand(batch=plan_fire_batches())
+
+    upload = upload_to_aws()
+    [temperatures, fire_batches] >> upload
+
+    loaded = load_to_postgres(temperatures)
+    fire_batches >> loaded
+
+    if GOLD_FROM_BRONZE:
+        # Postgres is still loaded, but the summary path only needs the bronze files.
+        # The rollups follow the load; the zone/monthly charts read them, so they wait.
+        gold = transform_gold_layer()
+        [temperatures, fire_batches] >> gold
+        rollups = refresh_fire_rollups(loaded)
+        chart = generate_chart(gold)
+        if ROLLUP_CHARTS:
+            rollups >> chart
+        [upload, loaded, gold, rollups] >> manage_bronze_lifecycle()
+    else:
+        gold = transform_gold_layer(loaded)
+        generate_chart(gold)
+        [upload, loaded, gold] >> manage_bronze_lifecycle()
+
 
-    #t1 and t2 can run in parallel since they are independent data fetches
-    [t1_fetch_temps, t2_fetch_fires]>>t3_upload_s3
-    # After uploading, we load and transform the data
-    t3_upload_s3>>t4_load_db
-    t4_load_db>>t5_transform>>t6_visualize
-    
\ No newline at end of file
+wildfire_climate_pipeline()
@@ -0,0 +1,387 @@
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+
+from date_windows import to_date
+from synthetic_firms import StubFirmsServer, gistemp_csv, write_bronze_csvs
+
+# --- CONFIGURATION ---
+# Runs pipeline stages as real subprocesses (exactly like the DAG does) against a
+# throwaway data folder, a stub FIRMS/GISTEMP server and moto (or MinIO), and
+# appends wall time, throughput and peak RSS per stage to a JSON results file.
+# Its extra dependencies (moto[server], numpy) are in requirements-dev.txt.
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+STAGES = ["fetch", "load", "transform", "upload", "visualize"]
+
+# Scripts run by each stage (the arguments are filled in by the harness)
+STAGE_SCRIPTS = {
+    "fetch": ["fetch_temperature.py", "fetch_fire_raw.py"],
+    "load": ["load_to_postgres.py"],
+    "transform": ["transform_data.py"],
+    "upload": ["upload_to_s3.py"],
+    "visualize": ["visualize_trends.py"],
+}
+
+# What a stage needs before it can run on its own: "bronze" is prepared directly
+# (synthetic files on disk), anything else is another stage run as setup
+STAGE_NEEDS = {"load": "bronze", "transform": "load", "upload": "bronze", "visualize": "transform"}
+DB_STAGES = {"load", "transform", "visualize"}
+
+RESULTS_FILE = os.getenv("BENCHMARK_RESULTS_FILE", "benchmark_results.json")
+BUCKET = "wildfire-benchmark"
+# moto accepts any credentials; a real MinIO takes them from the environment
+S3_CREDENTIALS = {
+    "AWS_ACCESS_KEY_ID": os.getenv("AWS_ACCESS_KEY_ID", "testing"),
+    "AWS_SECRET_ACCESS_KEY": os.getenv("AWS_SECRET_ACCESS_KEY", "testing"),
+    "AWS_DEFAULT_REGION": os.getenv("AWS_DEFAULT_REGION", "us-east-1"),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def folder_size(path):
+    total, files = 0, 0
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in names:
+            if not name.startswith("."):
+                total += os.path.getsize(os.path.join(root, name))
+                files += 1
+    return total, files
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Runs a script in-process and writes its peak RSS (KB) on exit. The high-water
+# mark in /proc belongs to the exec'd process alone, unlike wait4()'s ru_maxrss,
+# which inherits the (large) benchmark process it was forked from.
+RSS_PROBE = """
+import atexit, os, resource, runpy, sys
+def report(out=sys.argv[1]):
+    with open("/proc/self/status") as f:
+        peak = next(int(line.split()[1]) for line in f if line.startswith("VmHWM"))
+    peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    with open(out, "w") as f:
+        f.write(str(peak))
+atexit.register(report)
+sys.argv = sys.argv[2:]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+def run_script(script, args, env, log):
+    """Runs one pipeline script and returns (seconds, peak RSS in MB, exit code)."""
+    log.write(f"\n===== {script} {' '.join(args)} =====\n")
+    log.flush()
+    with tempfile.NamedTemporaryFile("r", suffix=".rss") as rss:
+        start = time.perf_counter()
+        exit_code = subprocess.call([sys.executable, "-c", RSS_PROBE, rss.name,
+                                     os.path.join(SCRIPTS_DIR, script), *args],
+                                    env=env, stdout=log, stderr=subprocess.STDOUT, cwd=SCRIPTS_DIR)
+        seconds = time.perf_counter() - start
+        peak_kb = rss.read().strip()
+    return seconds, int(peak_kb) / 1024 if peak_kb else None, exit_code
+
+
+class S3StandIn:
+    """moto's standalone server (default) or an existing endpoint such as MinIO."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.server = None
+        self.endpoint_url = os.getenv("S3_ENDPOINT_URL")
+
+    def __enter__(self):
+        if self.backend == "moto":
+            try:
+                from moto.server import ThreadedMotoServer
+            except ImportError:
+                raise SystemExit("--s3 moto needs moto[server] (pip install -r requirements-dev.txt)")
+
+            port = free_port()
+            logging.getLogger("werkzeug").setLevel(logging.ERROR)
+            self.server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+            self.server.start()
+            self.endpoint_url = f"http://127.0.0.1:{port}"
+        elif not self.endpoint_url:
+            raise SystemExit("--s3 endpoint needs S3_ENDPOINT_URL (e.g. a local MinIO)")
+
+        import boto3
+
+        s3 = boto3.client("s3", endpoint_url=self.endpoint_url,
+                          aws_access_key_id=S3_CREDENTIALS["AWS_ACCESS_KEY_ID"],
+                          aws_secret_access_key=S3_CREDENTIALS["AWS_SECRET_ACCESS_KEY"],
+                          region_name=S3_CREDENTIALS["AWS_DEFAULT_REGION"])
+        existing = {b["Name"] for b in s3.list_buckets().get("Buckets", [])}
+        if BUCKET not in existing:
+            s3.create_bucket(Bucket=BUCKET)
+        return self
+
+    def __exit__(self, *exc):
+        if self.server:
+            self.server.stop()
+
+
+class Benchmark:
+    def __init__(self, args, work_dir, stub, s3):
+        self.args = args
+        self.data_dir = os.path.join(work_dir, "data")
+        self.bronze_dir = os.path.join(self.data_dir, "bronze", "fires")
+        self.rows_per_day = max(1, math.ceil(args.rows / args.days))
+        self.start = to_date(args.start)
+        self.end = self.start + timedelta(days=args.days - 1)
+        self.total_rows = self.rows_per_day * args.days
+        self.done = set()
+        self.results = []
+        self.log = open(os.path.join(work_dir, "benchmark.log"), "w")
+
+        self.env = {
+            **os.environ,
+            "PIPELINE_DATA_DIR": self.data_dir,
+            "NASA_API_KEY": os.getenv("NASA_API_KEY", "benchmark"),
+            "FIRMS_BASE_URL": stub.base_url,
+            "GISTEMP_URL": stub.gistemp_url,
+            "FIRMS_REQUESTS_PER_MINUTE": "60000",
+            "FIRMS_BURST": "100",
+            "HTTP_CACHE_MODE": args.http_cache,
+            "FIRE_START_DATE": self.start.isoformat(),
+            "FIRE_END_DATE": self.end.isoformat(),
+            "S3_BUCKET_NAME": BUCKET,
+            **S3_CREDENTIALS,
+            "MPLBACKEND": "Agg",
+        }
+        if s3 and s3.endpoint_url:
+            self.env["S3_ENDPOINT_URL"] = s3.endpoint_url
+        if args.db_conn:
+            self.env["PIPELINE_DB_CONN"] = args.db_conn
+
+    def stage_args(self, stage, script):
+        if script == "fetch_fire_raw.py":
+            return ["--start", self.start.isoformat(), "--end", self.end.isoformat()]
+        if script == "load_to_postgres.py":
+            return ["--full-refresh"]
+        if script == "transform_data.py":
+            return ["--full-rebuild"]
+        return []
+
+    def prepare_bronze(self):
+        """Inputs for stages run without fetch: synthetic bronze CSVs + temperatures."""
+        start = time.perf_counter()
+        _, total_bytes = write_bronze_csvs(self.bronze_dir, self.start, self.end, self.rows_per_day)
+
+        # Same cleaning as fetch_temperature, from the synthetic GISTEMP table
+        lines = gistemp_csv().decode().splitlines()[2:]
+        with open(os.path.join(self.data_dir, "global_temps_clean.csv"), "w") as f:
+            f.write("year,temp_anomaly_celsius\n")
+            for line in lines:
+                values = line.split(",")
+                f.write(f"{values[0]},{values[13]}\n")
+
+        self.record("prepare", time.perf_counter() - start, None, 0, setup=True,
+                    rows=self.total_rows, bytes=total_bytes)
+        self.done.add("bronze")
+
+    def ensure(self, need):
+        if need in self.done:
+            return True
+        if need == "bronze":
+            if "fetch" in self.args.stages:
+                return self.run_stage("fetch")
+            self.prepare_bronze()
+            return True
+        return self.run_stage(need, setup=True)
+
+    def run_stage(self, stage, setup=False):
+        if stage in self.done:
+            return True
+        if stage in DB_STAGES and not self.args.db_conn:
+            print(f"[skip] {stage}: no database (--db-conn / PIPELINE_DB_CONN)")
+            return False
+        if stage in STAGE_NEEDS and not self.ensure(STAGE_NEEDS[stage]):
+            print(f"[skip] {stage}: its input stage did not run")
+            return False
+
+        seconds, peak_mb, exit_code = 0.0, 0.0, 0
+        counters, spans = {}, {}
+        for script in STAGE_SCRIPTS[stage]:
+            elapsed, peak, exit_code = run_script(script, self.stage_args(stage, script), self.env, self.log)
+            seconds += elapsed
+            peak_mb = max(peak_mb, peak or 0)
+
+            # Counters and span totals the script wrote through instrumentation.py
+            metrics = self.script_metrics(script)
+            for name, value in metrics.get("counters", {}).items():
+                counters[name] = counters.get(name, 0) + value
+            for name, span in metrics.get("spans", {}).items():
+                spans[name] = round(spans.get(name, 0) + span["seconds"], 4)
+            if exit_code != 0:
+                break
+
+        size, objects = folder_size(self.data_dir)
+        units = {"rows": self.total_rows} if stage in ("fetch", "load", "transform") else {}
+        if stage in ("fetch", "upload"):
+            units["bytes"] = size
+        if stage == "upload":
+            units["objects"] = objects
+
+        self.record(stage, seconds, peak_mb, exit_code, setup=setup, **units)
+        self.results[-1].update(counters=counters, spans=spans)
+        if exit_code == 0:
+            self.done.add(stage)
+            if stage == "fetch":
+                self.done.add("bronze")
+        return exit_code == 0
+
+    def script_metrics(self, script):
+        path = os.path.join(self.data_dir, ".metrics", script.replace(".py", ".json"))
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, stage, seconds, peak_mb, exit_code, setup=False, **units):
+        result = {"stage": stage, "setup": setup, "seconds": round(seconds, 3),
+                  "peak_rss_mb": round(peak_mb, 1) if peak_mb is not None else None,
+                  "exit_code": exit_code, **units}
+        if seconds > 0 and "rows" in units:
+            result["rows_per_sec"] = round(units["rows"] / seconds)
+        if seconds > 0 and "bytes" in units:
+            result["mb_per_sec"] = round(units["bytes"] / 1024 / 1024 / seconds, 2)
+        self.results.append(result)
+
+        status = "ok" if exit_code == 0 else f"FAILED (exit {exit_code})"
+        label = f"{stage} (setup)" if setup else stage
+        print(f"  {label:<18} {seconds:8.2f}s  "
+              f"{(result['peak_rss_mb'] or 0):8.1f} MB  "
+              f"{result.get('rows_per_sec', '-'):>10} rows/s  {status}")
+
+    def run(self):
+        ok = True
+        for stage in self.args.stages:
+            if not self.run_stage(stage):
+                ok = False
+                if stage in self.done or stage not in DB_STAGES or self.args.db_conn:
+                    break
+        return ok
+
+
+def compare_with_previous(run, history):
+    """Prints the change against the last run with the same scale and stages."""
+    same = ("rows", "days", "stages")
+    previous = [r for r in history if all(r["params"].get(k) == run["params"][k] for k in same)]
+    if not previous:
+        return
+    last = {s["stage"]: s for s in previous[-1]["stages"]}
+    print(f"\nCompared with run {previous[-1]['run_id']} ({previous[-1].get('git_commit')}):")
+    for stage in run["stages"]:
+        before = last.get(stage["stage"])
+        if stage["setup"]:
+            continue
+        if before and before["seconds"] > 0:
+            change = (stage["seconds"] - before["seconds"]) / before["seconds"] * 100
+            print(f"  {stage['stage']:<18} {before['seconds']:8.2f}s -> {stage['seconds']:8.2f}s ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic FIRMS data.")
+    parser.add_argument("--rows", type=int, default=100_000, help="Total fire detections (10k to 100M)")
+    parser.add_argument("--days", type=int, default=30, help="Days of data the rows are spread over")
+    parser.add_argument("--start", default="2023-01-01", help="First synthetic day")
+    parser.add_argument("--stages", default="all",
+                        help=f"Comma-separated subset of {','.join(STAGES)} (or 'all' for end to end)")
+    parser.add_argument("--db-conn", default=os.getenv("PIPELINE_DB_CONN"),
+                        help="SQLAlchemy URL of a Postgres the benchmark may overwrite")
+    parser.add_argument("--s3", choices=["moto", "endpoint", "none"], default="moto",
+                        help="moto server, an S3_ENDPOINT_URL such as MinIO, or skip uploads")
+    parser.add_argument("--http-cache", choices=["off", "on"], default="off",
+                        help="Run fetch through the HTTP cache (off measures the raw download path)")
+    parser.add_argument("--output", default=RESULTS_FILE, help="JSON file the results are appended to")
+    parser.add_argument("--work-dir", help="Keep the data here instead of a temporary folder")
+    args = parser.parse_args()
+
+    args.stages = STAGES if args.stages == "all" else [s.strip() for s in args.stages.split(",")]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+    if args.s3 == "none" and "upload" in args.stages:
+        args.stages.remove("upload")
+    # Stages always run in pipeline order
+    args.stages = [s for s in STAGES if s in args.stages]
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="wildfire-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+
+    print(f"--- Benchmark: {args.rows:,} rows over {args.days} days, stages {','.join(args.stages)} ---")
+    print(f"Work dir: {work_dir}")
+
+    started_at = datetime.utcnow().isoformat(timespec="seconds")
+    rows_per_day = max(1, math.ceil(args.rows / args.days))
+    s3_backend = S3StandIn(args.s3) if "upload" in args.stages else None
+
+    with ExitStack() as stack:
+        stub = stack.enter_context(StubFirmsServer(rows_per_day))
+        if s3_backend:
+            stack.enter_context(s3_backend)
+        bench = Benchmark(args, work_dir, stub, s3_backend)
+        stack.callback(bench.log.close)
+        ok = bench.run()
+
+    measured = [s for s in bench.results if not s["setup"]]
+    total = {"stage": "end_to_end", "setup": False,
+             "seconds": round(sum(s["seconds"] for s in measured), 3),
+             "peak_rss_mb": max((s["peak_rss_mb"] or 0 for s in measured), default=0),
+             "exit_code": 0 if ok else 1, "rows": bench.total_rows}
+    if total["seconds"] > 0:
+        total["rows_per_sec"] = round(bench.total_rows / total["seconds"])
+
+    run = {
+        "run_id": started_at,
+        "git_commit": git_commit(),
+        "params": {"rows": bench.total_rows, "days": args.days, "stages": args.stages,
+                   "s3": args.s3, "http_cache": args.http_cache},
+        "host": {"python": platform.python_version(), "platform": platform.platform(),
+                 "cpu_count": os.cpu_count()},
+        "stages": bench.results + [total],
+    }
+
+    history = []
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            history = json.load(f)
+    compare_with_previous(run, history)
+    with open(args.output, "w") as f:
+        json.dump(history + [run], f, indent=1)
+
+    print(f"\nEnd to end: {total['seconds']:.2f}s. Results appended to {args.output}")
+    print(f"Stage output: {os.path.join(work_dir, 'benchmark.log')}")
+    if not args.work_dir and ok:
+        shutil.rmtree(os.path.join(work_dir, "data"), ignore_errors=True)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import fcntl
+import json
+import os
+from datetime import datetime
+
+# --- CONFIGURATION ---
+CATALOG_NAME = ".catalog.json"
+
+
+class BronzeCatalog:
+    """
+    Maps the logical bronze files (one per window and month, the names the window
+    manifest and load_state know) to the physical files holding them today, and
+    says where each physical file lives:
+      {physical path: {"partition": "year=YYYY/month=MM", "rows", "bytes",
+                       "min_date", "max_date", "local": bool, "s3_key", "etag",
+                       "sources": [logical paths], "state": "ready" | "pending"}}
+    Paths are relative to the bronze directory. A compacted file lists the window
+    files merged into it as its sources; a plain window file is its own source.
+    A file evicted to S3 (local false) keeps its entry, so it still counts as
+    fetched and loaded. Saved atomically under a lock, like the window manifest:
+    each save re-reads the file and only applies this instance's put()/remove()
+    changes, so concurrent readers (loader, gold engine, lifecycle) keep theirs.
+    """
+
+    def __init__(self, base_dir, name=CATALOG_NAME):
+        self.base_dir = base_dir
+        self.path = os.path.join(base_dir, name)
+        self.changes = {}
+        self.entries = self._read()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def save(self):
+        os.makedirs(self.base_dir, exist_ok=True)
+        with open(self.path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            # Entries written by other processes since we loaded are kept
+            entries = self._read()
+            for rel_path, entry in self.changes.items():
+                if entry is None:
+                    entries.pop(rel_path, None)
+                else:
+                    entries[rel_path] = entry
+            self.entries = entries
+            self.changes = {}
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    def put(self, rel_path, **info):
+        # The returned entry may still be edited in place until the next save()
+        entry = self.entries.setdefault(rel_path, {"state": "ready", "local": True, "sources": [rel_path]})
+        entry.update(info, updated_at=datetime.utcnow().isoformat(timespec="seconds"))
+        self.changes[rel_path] = entry
+        return entry
+
+    def remove(self, rel_path):
+        self.changes[rel_path] = None
+        return self.entries.pop(rel_path, None)
+
+    def ready(self):
+        return {rel: entry for rel, entry in self.entries.items() if entry.get("state", "ready") == "ready"}
+
+    def physical_files(self):
+        """{logical path: [physical paths]} for every logical file the catalog knows."""
+        index = {}
+        for rel, entry in self.ready().items():
+            for source in entry.get("sources") or [rel]:
+                index.setdefault(source, []).append(rel)
+        return index
+
+    def resolve(self, rel_paths):
+        """Physical paths (sorted, each once) that hold the given logical paths."""
+        index = self.physical_files()
+        return sorted({physical for rel in rel_paths for physical in index.get(rel, [rel])})
+
+    def is_cold(self, rel_path):
+        entry = self.entries.get(rel_path)
+        return entry is not None and entry.get("state", "ready") == "ready" and not entry.get("local", True)
+
+    def cold_files(self):
+        return {rel: entry for rel, entry in self.ready().items() if not entry.get("local", True)}
+
+    def partitions(self):
+        """{partition: [physical paths]}: the logical partitions and their files."""
+        result = {}
+        for rel, entry in sorted(self.ready().items()):
+            result.setdefault(entry["partition"], []).append(rel)
+        return result
+
+
+def restore_cold_files(catalog, rel_paths, s3_client=None):
+    """
+    Downloads the evicted files among rel_paths back to the bronze directory, for
+    readers that need their rows. They stay in S3; the next lifecycle run evicts
+    them again if the local budget requires it. Returns the restored paths.
+    """
+    cold = [rel for rel in rel_paths if catalog.is_cold(rel)]
+    if not cold:
+        return []
+
+    from upload_to_s3 import AWS_BUCKET, TRANSFER_CONFIG, build_s3_client
+
+    s3 = s3_client or build_s3_client()
+    for rel in cold:
+        entry = catalog.entries[rel]
+        local_path = os.path.join(catalog.base_dir, rel)
+        # A concurrent reader (e.g. the loader next to the gold engine) may have
+        # restored it already; otherwise each process downloads to its own name
+        if not os.path.exists(local_path):
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            part_path = f"{local_path}.{os.getpid()}.part"
+            s3.download_file(AWS_BUCKET, entry["s3_key"], part_path, Config=TRANSFER_CONFIG)
+            os.replace(part_path, local_path)
+        catalog.put(rel, local=True)
+    catalog.save()
+    print(f"Restored {len(cold)} evicted bronze files from S3.")
+    return cold
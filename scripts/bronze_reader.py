@@ -0,0 +1,112 @@
+import os
+
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+from bronze_writer import BLOCK_SIZE, FIRE_COLUMN_TYPES
+
+# --- CONFIGURATION ---
+# Shared reader for everything that reads bronze fire data (loader, history, grid).
+# Only the requested columns are decoded, with compact types, one bounded batch at a time.
+
+# Memory ceiling for one decoded batch. Batch sizes are derived from it, so peak
+# memory stays flat however many days (or rows) a single file covers.
+READ_MEMORY_MB = float(os.getenv("FIRE_READ_MEMORY_MB", "64"))
+
+# Compact in-memory types: float32 coordinates (~1 m precision, plenty for the
+# 4-5 decimals FIRMS publishes) and a dictionary-encoded confidence (a handful
+# of distinct values: 0-100 for MODIS, l/n/h for VIIRS)
+COMPACT_COLUMN_TYPES = {
+    **FIRE_COLUMN_TYPES,
+    "latitude": pa.float32(),
+    "longitude": pa.float32(),
+    "confidence": pa.dictionary(pa.int32(), pa.string()),
+}
+
+# Rough decoded width of variable-size values (string bytes plus offsets)
+STRING_BYTES = 16
+
+# Arrow's streaming CSV reader keeps up to ~32 blocks in flight (read-ahead plus
+# parse), so its block size is the ceiling divided by this
+CSV_BLOCKS_IN_FLIGHT = 32
+
+
+def batch_rows(columns, column_types, memory_mb=READ_MEMORY_MB):
+    """Rows per batch so one decoded batch of `columns` stays under memory_mb."""
+    row_bytes = 0
+    for name in columns:
+        column_type = column_types.get(name, pa.string())
+        if pa.types.is_dictionary(column_type):
+            column_type = column_type.index_type
+        try:
+            row_bytes += max(1, column_type.bit_width // 8)
+        except ValueError:
+            # Variable-width type (strings)
+            row_bytes += STRING_BYTES
+    # Each column also carries a validity bitmap; keep half the budget as headroom
+    # for the transient copies made while casting and filtering
+    return max(1024, int(memory_mb * 1024 * 1024 / 2 / max(1, row_bytes)))
+
+
+def iter_bronze_batches(file_path, columns, column_types=None, memory_mb=READ_MEMORY_MB):
+    """
+    Yields Arrow record batches with exactly `columns` (in that order) from one
+    bronze file, Parquet or raw CSV.
+     - Only the requested columns are ever decoded; missing ones come back as nulls.
+     - Columns are cast to column_types (COMPACT_COLUMN_TYPES by default).
+     - Each batch stays under memory_mb once decoded.
+    """
+    column_types = column_types or COMPACT_COLUMN_TYPES
+    if not file_path.endswith(".parquet"):
+        yield from iter_csv_batches(file_path, columns, column_types, memory_mb)
+        return
+
+    # Dictionary columns are decoded straight into dictionary arrays, and reads are
+    # buffered column chunk by column chunk instead of pre-buffering a row group
+    dictionary_columns = [c for c in columns if pa.types.is_dictionary(column_types.get(c, pa.string()))]
+    parquet_file = pq.ParquetFile(file_path, read_dictionary=dictionary_columns,
+                                  buffer_size=BLOCK_SIZE, pre_buffer=False)
+    present = [c for c in columns if c in parquet_file.schema_arrow.names]
+    rows = batch_rows(columns, column_types, memory_mb)
+
+    for batch in parquet_file.iter_batches(batch_size=rows, columns=present):
+        yield select_columns(batch, columns, column_types)
+
+
+def iter_csv_batches(source, columns, column_types=None, memory_mb=READ_MEMORY_MB):
+    """
+    Same as iter_bronze_batches() for a FIRMS CSV given as a path or a binary
+    stream (e.g. an HTTP response body), parsed one block at a time straight into
+    the target types.
+    """
+    column_types = column_types or COMPACT_COLUMN_TYPES
+    block_size = int(min(BLOCK_SIZE, max(256 * 1024, memory_mb * 1024 * 1024 / CSV_BLOCKS_IN_FLIGHT)))
+    read_options = pv.ReadOptions(block_size=block_size)
+    convert_options = pv.ConvertOptions(column_types={c: column_types[c] for c in columns if c in column_types},
+                                        include_columns=list(columns), include_missing_columns=True,
+                                        strings_can_be_null=True)
+    try:
+        batches = pv.open_csv(source, read_options=read_options, convert_options=convert_options)
+    except pa.ArrowInvalid as e:
+        if "Empty CSV file" in str(e):
+            return
+        raise
+
+    for batch in batches:
+        yield select_columns(batch, columns, column_types)
+
+
+def select_columns(batch, columns, column_types=COMPACT_COLUMN_TYPES):
+    arrays = []
+    for name in columns:
+        column_type = column_types.get(name, pa.string())
+        if name not in batch.schema.names:
+            arrays.append(pa.nulls(batch.num_rows, column_type))
+            continue
+
+        array = batch.column(name)
+        if array.type != column_type:
+            array = array.cast(column_type)
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, names=list(columns))
@@ -0,0 +1,192 @@
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+from instrumentation import count
+
+# --- CONFIGURATION ---
+# "parquet" (default) or "csv" for the old raw layout
+BRONZE_FORMAT = os.getenv("FIRE_BRONZE_FORMAT", "parquet").lower()
+COMPRESSION = os.getenv("FIRE_PARQUET_COMPRESSION", "zstd")
+COMPRESSION_LEVEL = int(os.getenv("FIRE_PARQUET_COMPRESSION_LEVEL", "3"))
+
+# How much CSV text the Arrow reader parses per record batch.
+# Memory use is bounded by roughly this times a small constant, whatever the file size.
+BLOCK_SIZE = int(os.getenv("FIRE_CSV_BLOCK_SIZE", str(8 * 1024 * 1024)))
+
+# Typed columns for the FIRMS CSV products (MODIS and VIIRS).
+# Columns not listed here are still kept, with the type Arrow infers.
+FIRE_COLUMN_TYPES = {
+    "latitude": pa.float64(),
+    "longitude": pa.float64(),
+    "brightness": pa.float32(),
+    "bright_t31": pa.float32(),
+    "bright_ti4": pa.float32(),
+    "bright_ti5": pa.float32(),
+    "scan": pa.float32(),
+    "track": pa.float32(),
+    "acq_date": pa.date32(),
+    "acq_time": pa.int16(),      # HHMM in UTC
+    "satellite": pa.string(),
+    "instrument": pa.string(),
+    "confidence": pa.string(),   # 0-100 for MODIS, l/n/h for VIIRS
+    "version": pa.string(),
+    "frp": pa.float32(),         # Fire Radiative Power (MW)
+    "daynight": pa.string(),
+    "type": pa.int8(),
+}
+
+
+def parse_acq_dates(batch):
+    """acq_date (read as text by open_fire_csv) as date32; a malformed date becomes null."""
+    index = batch.schema.get_field_index("acq_date")
+    if index < 0 or batch.schema.field(index).type == pa.date32():
+        return batch
+    timestamps = pc.strptime(batch.column(index), format="%Y-%m-%d", unit="s", error_is_null=True)
+    columns = list(batch.columns)
+    columns[index] = pc.cast(timestamps, pa.date32())
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def drop_undated_rows(batch):
+    """
+    The batch without its rows that have no acq_date (missing or malformed): they
+    cannot be partitioned or loaded. They are counted as rows_without_date.
+    """
+    dated = pc.is_valid(batch.column("acq_date"))
+    undated = batch.num_rows - pc.sum(dated).as_py() if batch.num_rows else 0
+    if not undated:
+        return batch
+    count("rows_without_date", undated)
+    print(f"[WARN] Dropped {undated} rows without a valid acq_date.")
+    return batch.filter(dated)
+
+
+def partition_dir(base_dir, year, month):
+    # Hive layout, e.g. bronze/fires/year=2023/month=08
+    return os.path.join(base_dir, f"year={year}", f"month={month:02d}")
+
+
+class PartitionedParquetWriter:
+    """
+    Writes record batches as Hive-partitioned Parquet, one file per (year, month)
+    touched: <base_dir>/year=YYYY/month=MM/<file_stem>.parquet
+     - Files are written as .part and renamed by close(), so a failure (abort())
+       leaves nothing behind.
+     - open_sink(path), if given, returns the binary file object a partition's
+       Parquet bytes go to instead of <path>.part (e.g. a tee to S3); it must
+       write <path>.part itself.
+    """
+
+    def __init__(self, base_dir, file_stem, open_sink=None):
+        self.base_dir = base_dir
+        self.file_stem = file_stem
+        self.open_sink = open_sink
+        self.writers = {}
+        self.partitions = {}
+        self.rows = 0
+
+    def write(self, batch):
+        batch = drop_undated_rows(parse_acq_dates(batch))
+        if batch.num_rows == 0:
+            return
+        self.rows += batch.num_rows
+
+        table = pa.Table.from_batches([batch])
+        years = pc.year(table["acq_date"])
+        months = pc.month(table["acq_date"])
+
+        # A window can straddle a month boundary, so split the batch per partition
+        keys = pc.add(pc.multiply(years, 100), months)
+        for key in pc.unique(keys).to_pylist():
+            part = table.filter(pc.equal(keys, key))
+            if key not in self.writers:
+                self._open(key, part.schema)
+            path, writer, _ = self.writers[key]
+            writer.write_table(part)
+
+            info = self.partitions[path]
+            bounds = pc.min_max(part["acq_date"]).as_py()
+            info["rows"] += part.num_rows
+            if bounds["min"] is not None:
+                info["min_date"] = min(info["min_date"] or bounds["min"], bounds["min"])
+                info["max_date"] = max(info["max_date"] or bounds["max"], bounds["max"])
+
+    def _open(self, key, schema):
+        year, month = divmod(key, 100)
+        out_dir = partition_dir(self.base_dir, year, month)
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"{self.file_stem}.parquet")
+
+        sink = self.open_sink(path) if self.open_sink else None
+        writer = pq.ParquetWriter(sink if sink is not None else path + ".part", schema,
+                                  compression=COMPRESSION, compression_level=COMPRESSION_LEVEL)
+        self.writers[key] = (path, writer, sink)
+        self.partitions[path] = {"rows": 0, "min_date": None, "max_date": None}
+
+    def close(self):
+        """Finishes every file. Returns {"rows", "files", "partitions": {path: {rows, min_date, max_date}}}."""
+        for path, writer, sink in self.writers.values():
+            writer.close()
+            if sink is not None:
+                sink.close()
+        files = []
+        for path, _, _ in self.writers.values():
+            os.replace(path + ".part", path)
+            files.append(path)
+        return {"rows": self.rows, "files": sorted(files), "partitions": self.partitions}
+
+    def abort(self):
+        for path, writer, sink in self.writers.values():
+            writer.close()
+            if sink is not None:
+                # A tee to S3 aborts its multipart upload instead of completing it
+                getattr(sink, "abort", sink.close)()
+            if os.path.exists(path + ".part"):
+                os.remove(path + ".part")
+        self.writers = {}
+
+
+def open_fire_csv(stream):
+    """
+    Record batches of a FIRMS CSV stream with the bronze column types (None if the
+    body is empty). acq_date is parsed leniently: rows whose date is missing or
+    malformed are dropped (see drop_undated_rows) instead of failing the stream.
+    """
+    read_options = pv.ReadOptions(block_size=BLOCK_SIZE)
+    convert_options = pv.ConvertOptions(column_types={**FIRE_COLUMN_TYPES, "acq_date": pa.string()},
+                                        strings_can_be_null=True)
+    try:
+        reader = pv.open_csv(stream, read_options=read_options, convert_options=convert_options)
+    except pa.ArrowInvalid as e:
+        # An empty body (no detections and no header) is a valid "0 fires" answer
+        if "Empty CSV file" in str(e):
+            return None
+        raise
+    return (drop_undated_rows(parse_acq_dates(batch)) for batch in reader)
+
+
+def stream_csv_to_parquet(stream, base_dir, file_stem):
+    """
+    Parses a FIRMS CSV stream batch by batch and writes Hive-partitioned Parquet
+    (see PartitionedParquetWriter). The whole CSV is never held in memory; only
+    one record batch at a time.
+    Returns {"rows": n, "files": [paths]}.
+    """
+    reader = open_fire_csv(stream)
+    if reader is None:
+        return {"rows": 0, "files": []}
+
+    writer = PartitionedParquetWriter(base_dir, file_stem)
+    try:
+        for batch in reader:
+            writer.write(batch)
+    except Exception:
+        writer.abort()
+        raise
+
+    result = writer.close()
+    return {"rows": result["rows"], "files": result["files"]}
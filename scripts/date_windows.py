@@ -0,0 +1,197 @@
+import fcntl
+import json
+import os
+import re
+import threading
+from datetime import date, datetime, timedelta
+
+# --- CONFIGURATION ---
+# The FIRMS Area API accepts a [DAYS] range of 1..10 per request
+MAX_DAYS_PER_REQUEST = 10
+
+MANIFEST_NAME = ".manifest.json"
+
+
+def to_date(value):
+    """Accepts a date, datetime or 'YYYY-MM-DD' string."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def plan_windows(start_date, end_date, max_days=MAX_DAYS_PER_REQUEST, done_dates=()):
+    """
+    Splits the inclusive range [start_date, end_date] into API windows.
+     - Each window is (window_start, days) with days <= max_days.
+     - Days in done_dates are left out, so a new window never overlaps a window
+       that was already fetched (no duplicate detections when a range grows).
+     - Windows never cross a year boundary, so every window belongs to exactly one
+       bronze year folder and can be reloaded as a single fire_date range.
+    """
+    start = to_date(start_date)
+    end = to_date(end_date)
+    max_days = max(1, min(int(max_days), MAX_DAYS_PER_REQUEST))
+    done_dates = set(done_dates)
+
+    if end < start:
+        raise ValueError(f"End date {end} is before start date {start}")
+
+    windows = []
+    window_start = None
+    days = 0
+    current = start
+    while current <= end:
+        if current in done_dates:
+            if window_start:
+                windows.append((window_start, days))
+                window_start = None
+        else:
+            if window_start and (days == max_days or current.year != window_start.year):
+                windows.append((window_start, days))
+                window_start = None
+
+            if not window_start:
+                window_start, days = current, 0
+            days += 1
+        current += timedelta(days=1)
+
+    if window_start:
+        windows.append((window_start, days))
+
+    return windows
+
+
+def window_key(area, window_start, days):
+    # Stable identifier used in manifests, e.g. "world/2023-08-01/10"
+    return f"{area}/{to_date(window_start).isoformat()}/{days}"
+
+
+def parse_window_key(key):
+    area, window_start, days = key.split("/")
+    return area, to_date(window_start), int(days)
+
+
+def window_dates(window_start, days):
+    start = to_date(window_start)
+    return [start + timedelta(days=i) for i in range(days)]
+
+
+def window_path(base_dir, area, window_start, days, extension="csv"):
+    """
+    Deterministic bronze path for a window, e.g.
+    bronze/fires/2023/fires_world_2023-08-01_10d.csv
+    One-day windows keep the original fires_world_<date>.csv name.
+    """
+    start = to_date(window_start)
+    suffix = "" if days == 1 else f"_{days}d"
+    file_name = f"fires_{area}_{start.isoformat()}{suffix}.{extension}"
+    return os.path.join(base_dir, str(start.year), file_name)
+
+
+WINDOW_FILE_PATTERN = re.compile(r"^fires_(?P<area>.+?)_(?P<start>\d{4}-\d{2}-\d{2})(?:_(?P<days>\d+)d)?\.(?P<ext>\w+)$")
+
+
+def parse_window_path(file_path):
+    """Inverse of window_path(): returns (area, window_start, days) or None."""
+    match = WINDOW_FILE_PATTERN.match(os.path.basename(file_path))
+    if not match:
+        return None
+    return match["area"], to_date(match["start"]), int(match["days"] or 1)
+
+
+HIVE_MONTH_PATTERN = re.compile(r"year=(?P<year>\d{4})[\\/]month=(?P<month>\d{1,2})")
+
+
+def earliest_day(file_path):
+    """
+    Lower bound of the days a bronze file can hold, from its path alone: the later
+    of its year=/month= partition start and its window start (date.min if neither).
+    """
+    bounds = [date.min]
+    partition = HIVE_MONTH_PATTERN.search(file_path)
+    if partition:
+        bounds.append(date(int(partition["year"]), int(partition["month"]), 1))
+    parsed = parse_window_path(file_path)
+    if parsed:
+        bounds.append(parsed[1])
+    return max(bounds)
+
+
+class WindowManifest:
+    """
+    JSON record of the windows that completed successfully.
+    Saved atomically after every update so a killed task or an Airflow retry
+    only fetches what is still missing. Several processes (parallel mapped
+    tasks) can share one manifest: each save re-reads the file under a lock
+    and only applies this process's own changes to it.
+    """
+
+    def __init__(self, base_dir, name=MANIFEST_NAME):
+        self.path = os.path.join(base_dir, name)
+        self.lock = threading.Lock()
+        self.changes = {}
+        self.entries = self._read()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def is_done(self, key, file_path=None):
+        # A window only counts as done if its file is still on disk
+        if key not in self.entries:
+            return False
+        return file_path is None or os.path.exists(file_path)
+
+    def covered_dates(self, area, exists=None):
+        """
+        Every day already fetched for an area. Pass exists(key) to ignore
+        entries whose output has since been deleted.
+        """
+        dates = set()
+        for key in list(self.entries):
+            entry_area, window_start, days = parse_window_key(key)
+            if entry_area != area:
+                continue
+            if exists and not exists(key):
+                continue
+            dates.update(window_dates(window_start, days))
+        return dates
+
+    def forget(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.changes[key] = None
+                self._save()
+
+    def mark_done(self, key, **info):
+        with self.lock:
+            info["completed_at"] = datetime.utcnow().isoformat(timespec="seconds")
+            self.entries[key] = info
+            self.changes[key] = info
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            # Entries written by other processes since we loaded are kept
+            entries = self._read()
+            for key, info in self.changes.items():
+                if info is None:
+                    entries.pop(key, None)
+                else:
+                    entries[key] = info
+            self.entries = entries
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
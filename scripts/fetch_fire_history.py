@@ -1,78 +1,217 @@
-import requests
+import argparse
 import pandas as pd
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from io import StringIO
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from bronze_reader import iter_bronze_batches, iter_csv_batches
+from date_windows import (MAX_DAYS_PER_REQUEST, WindowManifest, earliest_day, parse_window_key, plan_windows,
+                          to_date, window_dates, window_key)
+from fetch_fire_raw import bronze_window_files
+from fire_dedup import KEY_COLUMNS, DedupFilter, with_dedup_keys
+from firms_client import FirmsClient, InvalidApiKeyError, area_url, MAX_WORKERS
+from instrumentation import count, run_stage, span
+from pg_copy import LOAD_COLUMN_TYPES
 
 load_dotenv()
 API_KEY = os.getenv("NASA_API_KEY")
 
-OUTPUT_DIR = "/opt/airflow/data"
+OUTPUT_DIR = os.getenv("PIPELINE_DATA_DIR", "/opt/airflow/data")
 FINAL_FILE = os.path.join(OUTPUT_DIR, "global_fires_history.csv")
+YEARLY_FILE = os.path.join(OUTPUT_DIR, "global_fires_yearly.csv")
+MANIFEST_NAME = ".history_manifest.json"
 
 # We use the Standard Product (MODIS_SP) which is scientifically quality-controlled
 SOURCE = "MODIS_SP"
 AREA = "world" # The Area API accepts 'world' as a shortcut for the whole globe
-START_YEAR = 2001
-END_YEAR = 2023
-
-def fetch_fire_history():
-    if not API_KEY:
-        print("CRITICAL ERROR: NASA_API_KEY not found.")
-        return
-
-    all_years_data = []
-    print(f"Starting Historical Scan ({START_YEAR}-{END_YEAR}) using Area API...")
-
-    for year in range(START_YEAR, END_YEAR + 1):
-        # We take a 1-day sample from the peak of fire season (August 1st)
-        target_date = f"{year}-08-01"
-        
-        # URL Format: /api/area/csv/[KEY]/[SOURCE]/[AREA]/[DAYS]/[DATE]
-        # We ask for 1 day of data starting on target_date
-        url = f"https://firms.modaps.eosdis.nasa.gov/api/area/csv/{API_KEY}/{SOURCE}/{AREA}/1/{target_date}"
-        
-        try:
-            print(f"Fetching global fires for {target_date}...", end=" ", flush=True)
-            response = requests.get(url, timeout=60) # Give NASA time to process massive files
-            
-            if response.status_code != 200:
-                print(f"[ERROR] API returned {response.status_code}")
+START_DATE = os.getenv("HISTORY_START_DATE", "2001-01-01")
+END_DATE = os.getenv("HISTORY_END_DATE", "2023-12-31")
+DAYS_PER_REQUEST = int(os.getenv("FIRE_DAYS_PER_REQUEST", str(MAX_DAYS_PER_REQUEST)))
+
+# Only these two columns are ever decoded from API responses; bronze files also
+# give the dedup_key columns, so a detection held by several files counts once
+STAT_COLUMNS = ["acq_date", "frp"]
+BRONZE_COLUMNS = KEY_COLUMNS + ["frp"]
+
+def merge_day(stats, day, fire_count, frp_count, frp_sum, frp_max):
+    # Per-day partial aggregates: [fire count, FRP count, FRP sum, FRP max]
+    current = stats.setdefault(day, [0, 0, 0.0, None])
+    current[0] += fire_count
+    current[1] += frp_count
+    current[2] += frp_sum or 0.0
+    if frp_max is not None and (current[3] is None or frp_max > current[3]):
+        current[3] = frp_max
+
+def aggregate_batches(batches, stats, days=None):
+    """
+    Folds record batches (acq_date, frp) into per-day stats, one batch at a time,
+    so memory stays constant however large the file is. When `days` is given,
+    rows for any other day are ignored.
+    """
+    value_set = pa.array(sorted(days), pa.date32()) if days is not None else None
+
+    for batch in batches:
+        count("rows_parsed", batch.num_rows)
+        table = pa.Table.from_batches([batch])
+        if value_set is not None:
+            table = table.filter(pc.is_in(table["acq_date"], value_set=value_set))
+        if table.num_rows == 0:
+            continue
+
+        grouped = table.group_by("acq_date").aggregate(
+            [("acq_date", "count"), ("frp", "count"), ("frp", "sum"), ("frp", "max")])
+        for row in grouped.to_pylist():
+            merge_day(stats, row["acq_date"].isoformat(), row["acq_date_count"],
+                      row["frp_count"], row["frp_sum"], row["frp_max"])
+
+def stats_from_bronze(start_date, end_date):
+    """
+    Aggregates the bronze files fetch_fire_raw already wrote (Parquet, or the raw
+    CSVs for windows that only exist in that format), each detection counted once.
+    Returns (stats, covered): covered holds every day of a bronze window, including
+    days without a single detection.
+    """
+    stats, covered = {}, set()
+
+    # A compacted file holds several windows: collect their days, then read it once
+    days_by_file = {}
+    for key, file_paths in bronze_window_files().items():
+        _, window_start, days = parse_window_key(key)
+        # Days already taken from another window are skipped (legacy overlaps)
+        wanted = {d for d in window_dates(window_start, days)
+                  if start_date <= d <= end_date and d not in covered}
+        if not wanted:
+            continue
+
+        for file_path in file_paths:
+            days_by_file.setdefault(file_path, set()).update(wanted)
+        covered |= wanted
+
+    # Same detection in several files (overlapping windows, or sources mixed in
+    # one compacted file): counted once, as in raw_fires (fire_dedup.py). Files go
+    # in order of their earliest possible day and the filter forgets only the days
+    # no later file can hold, so no day is split
+    dedup_filter = DedupFilter(memory_mb=None)
+    for file_path, wanted in sorted(days_by_file.items(), key=lambda item: (earliest_day(item[0]), item[0])):
+        dedup_filter.forget_before(earliest_day(file_path))
+        with span("aggregate_bronze", file=os.path.basename(file_path)):
+            batches = (with_dedup_keys(batch, STAT_COLUMNS, dedup_filter)
+                       for batch in iter_bronze_batches(file_path, BRONZE_COLUMNS, LOAD_COLUMN_TYPES))
+            aggregate_batches(batches, stats, wanted)
+
+    # Covered days without a single detection still get a (zero) row
+    for day in covered:
+        stats.setdefault(day.isoformat(), [0, 0, 0.0, None])
+    return stats, covered
+
+def fetch_missing_windows(pending, manifest):
+    """
+    Network fallback for days that are not in bronze: streams each window through
+    the same aggregation and records its per-day stats in the history manifest.
+    Returns the number of windows that failed.
+    """
+    def aggregate_window(client, window_start, days):
+        url = area_url(API_KEY, SOURCE, AREA, days, window_start.isoformat())
+        window_stats = {}
+        with span("fetch_window", window=window_key(AREA, window_start, days)), client.open_stream(url) as stream:
+            aggregate_batches(iter_csv_batches(stream, STAT_COLUMNS), window_stats)
+            count("bytes_downloaded", stream.bytes_read)
+        return window_stats
+
+    failed = 0
+
+    with FirmsClient() as client, ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {pool.submit(aggregate_window, client, start, days): (start, days)
+                   for start, days in pending}
+
+        for future in as_completed(futures):
+            start, days = futures[future]
+            key = window_key(AREA, start, days)
+            try:
+                window_stats = future.result()
+            except InvalidApiKeyError:
+                raise
+            except Exception as e:
+                print(f"\n[FAILED] {key}: {e}")
+                failed += 1
                 continue
 
-            # The response is a big CSV string. 
-            # If "No Data", the body might be short or just a header.
-            csv_text = response.text
-            
-            # Simple check: If it's just a header, count is 0
-            row_count = csv_text.strip().count('\n') 
-            # Note: The first line is header, so actual fires = row_count (if > 0)
-            
-            if row_count > 0:
-                print(f"-> Found {row_count} fires.")
-                all_years_data.append({
-                    "year": year,
-                    "date": target_date,
-                    "global_fire_count": row_count
-                })
-            else:
-                print("-> 0 fires.")
-
-            # Sleep to prevent rate limiting (Area API is heavy)
-            time.sleep(1.5)
-
-        except Exception as e:
-            print(f"\n[FAILED] {year}: {e}")
-
-    # Save Results
-    if all_years_data:
-        df = pd.DataFrame(all_years_data)
-        df.to_csv(FINAL_FILE, index=False)
-        print(f"\nSUCCESS: History saved to {FINAL_FILE}")
-        print(df)
-    else:
-        print("\nFAILURE: No data collected.")
+            manifest.mark_done(key, stats=window_stats)
+            print(f"{key} -> Found {sum(s[0] for s in window_stats.values())} fires.")
+        print(f"HTTP cache: {client.cache.summary()}")
+    return failed
+
+def stats_from_manifest(manifest, start_date, end_date, exclude):
+    """Per-day stats of the windows fetched over the network on earlier runs."""
+    stats = {}
+    for key, entry in manifest.entries.items():
+        _, window_start, days = parse_window_key(key)
+        days_in_window = {d.isoformat() for d in window_dates(window_start, days)
+                          if start_date <= d <= end_date and d not in exclude}
+        # Entries written before FRP stats existed only hold plain counts
+        day_stats = entry.get("stats") or {day: [fire_count, 0, 0.0, None]
+                                           for day, fire_count in entry.get("counts", {}).items()}
+        for day in days_in_window:
+            merge_day(stats, day, *day_stats.get(day, [0, 0, 0.0, None]))
+    return stats
+
+def fetch_fire_history(start_date=START_DATE, end_date=END_DATE, days_per_request=DAYS_PER_REQUEST):
+    start_date, end_date = to_date(start_date), to_date(end_date)
+    print(f"Building Fire History ({start_date} to {end_date})...")
+
+    # 1. Everything the bronze layer already has: no API calls at all
+    started = time.perf_counter()
+    stats, covered = stats_from_bronze(start_date, end_date)
+    print(f"Aggregated {len(covered)} days from bronze files in {time.perf_counter() - started:.1f}s.")
+
+    # 2. Days only the network can answer (kept in a manifest between runs)
+    manifest = WindowManifest(OUTPUT_DIR, MANIFEST_NAME)
+    pending = plan_windows(start_date, end_date, days_per_request, covered | manifest.covered_dates(AREA))
+
+    failed = 0
+    if pending:
+        print(f"Fetching {len(pending)} missing windows from the Area API...")
+        if not API_KEY:
+            raise RuntimeError("NASA_API_KEY not found.")
+        failed = fetch_missing_windows(pending, manifest)
+
+    stats.update(stats_from_manifest(manifest, start_date, end_date, covered))
+
+    # 3. Save Results (one row per day, plus a yearly roll-up)
+    if not stats:
+        raise RuntimeError("No data collected.")
+
+    df = pd.DataFrame(
+        [(int(day[:4]), day, fire_count, frp_count, frp_sum, frp_max)
+         for day, (fire_count, frp_count, frp_sum, frp_max) in stats.items()],
+        columns=["year", "date", "global_fire_count", "frp_count", "frp_sum", "frp_max"],
+    ).sort_values("date")
+    df["frp_mean"] = df["frp_sum"] / df["frp_count"].where(df["frp_count"] > 0)
+    df.to_csv(FINAL_FILE, index=False)
+
+    yearly = df.groupby("year").agg(days=("date", "count"), global_fire_count=("global_fire_count", "sum"),
+                                    frp_count=("frp_count", "sum"), frp_sum=("frp_sum", "sum"),
+                                    frp_max=("frp_max", "max")).reset_index()
+    yearly["frp_mean"] = yearly["frp_sum"] / yearly["frp_count"].where(yearly["frp_count"] > 0)
+    yearly.to_csv(YEARLY_FILE, index=False)
+
+    print(f"\nSUCCESS: History saved to {FINAL_FILE} and {YEARLY_FILE}")
+    print(yearly[["year", "days", "global_fire_count", "frp_mean", "frp_max"]].to_string(index=False))
+
+    # The history is saved either way; a retry only fetches the windows that failed
+    if failed:
+        raise RuntimeError(f"{failed} windows failed, the history has gaps.")
 
 if __name__ == "__main__":
-    fetch_fire_history()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the daily global fire count history.")
+    parser.add_argument("--start", default=START_DATE, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--end", default=END_DATE, help="Last day (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=DAYS_PER_REQUEST, help="Days per API request (1-10)")
+    args = parser.parse_args()
+
+    with run_stage("fetch_fire_history"):
+        fetch_fire_history(args.start, args.end, args.days)
@@ -1,82 +1,203 @@
-import requests
+import argparse
 import os
 import time
+from glob import glob
 from dotenv import load_dotenv
 
+from bronze_catalog import BronzeCatalog, restore_cold_files
+from bronze_writer import BRONZE_FORMAT, stream_csv_to_parquet
+from date_windows import (MAX_DAYS_PER_REQUEST, WindowManifest, parse_window_path, plan_windows, to_date,
+                          window_key, window_path)
+from firms_client import FirmsClient, area_url, MAX_WORKERS, REQUESTS_PER_MINUTE
+from instrumentation import count, run_stage
+from stream_handoff import STREAM_MODE, StreamHandoff
+
 
 load_dotenv()
 API_KEY = os.getenv("NASA_API_KEY")
 
 # 2. Configuration
-BASE_OUTPUT_DIR = "/opt/airflow/data/bronze/fires"
+DATA_DIR = os.getenv("PIPELINE_DATA_DIR", "/opt/airflow/data")
+BASE_OUTPUT_DIR = os.path.join(DATA_DIR, "bronze/fires")
 SOURCE = "MODIS_SP"  # Standard Product (Science Quality)
 AREA = "world"       # Global coverage
 
-# Grab data from 2000 to 2023
-START_YEAR = 2000
-END_YEAR = 2023
+# Grab every day from 2000 to 2023 (full fire seasons, not a single sample day).
+# Override with FIRE_START_DATE / FIRE_END_DATE or --start / --end.
+START_DATE = os.getenv("FIRE_START_DATE", "2000-01-01")
+END_DATE = os.getenv("FIRE_END_DATE", "2023-12-31")
+
+# Days per API request (FIRMS [DAYS] parameter, max 10). Bigger windows = fewer requests.
+DAYS_PER_REQUEST = int(os.getenv("FIRE_DAYS_PER_REQUEST", str(MAX_DAYS_PER_REQUEST)))
+
+def bronze_files_on_disk():
+    """
+    Groups every bronze file (raw CSV or partitioned Parquet) by its window key.
+    Window files since merged into a compacted file or evicted to S3 are still
+    listed, under their own (logical) names, from the catalog.
+    """
+    patterns = [os.path.join(BASE_OUTPUT_DIR, "*", f"fires_{AREA}_*.csv"),
+                os.path.join(BASE_OUTPUT_DIR, "year=*", "month=*", f"fires_{AREA}_*.parquet")]
+    rel_paths = {os.path.relpath(file_path, BASE_OUTPUT_DIR) for pattern in patterns for file_path in glob(pattern)}
+    rel_paths.update(BronzeCatalog(BASE_OUTPUT_DIR).physical_files())
+
+    files_by_key = {}
+    for rel_path in sorted(rel_paths):
+        parsed = parse_window_path(rel_path)
+        if parsed and parsed[0] == AREA:
+            files_by_key.setdefault(window_key(*parsed), []).append(rel_path)
+    return files_by_key
+
+def bronze_window_files():
+    """
+    Absolute bronze paths per window key, for readers of the bronze layer.
+    A window re-fetched after switching BRONZE_FORMAT exists twice: only its
+    Parquet files are returned then, so no detection is read twice.
+    Paths are the physical files: a compacted file holds several windows and is
+    listed under each of them (see bronze_read_files), and files evicted to S3
+    are downloaded back first.
+    """
+    catalog = BronzeCatalog(BASE_OUTPUT_DIR)
+    window_files = {}
+    for key, rel_paths in sorted(bronze_files_on_disk().items()):
+        parquet = [p for p in rel_paths if p.endswith(".parquet")]
+        window_files[key] = catalog.resolve(parquet or rel_paths)
+
+    restore_cold_files(catalog, sorted({p for paths in window_files.values() for p in paths}))
+    return {key: [os.path.join(BASE_OUTPUT_DIR, p) for p in paths] for key, paths in window_files.items()}
 
-def fetch_raw_fire_data():
+def bronze_read_files():
+    """Every bronze file to read, once (a compacted file holds several windows)."""
+    return sorted({path for paths in bronze_window_files().values() for path in paths})
+
+def sync_manifest(manifest):
+    """
+    Makes the manifest agree with what is actually on disk.
+     - Files written before the manifest existed are adopted (downloads are atomic).
+     - Entries whose files were deleted are forgotten so those days get fetched again.
+       Files compacted or evicted to S3 are not deleted: the catalog still holds them.
+    """
+    cataloged = BronzeCatalog(BASE_OUTPUT_DIR).physical_files()
+    files_by_key = bronze_files_on_disk()
+    for key, files in files_by_key.items():
+        if not manifest.get(key):
+            manifest.mark_done(key, files=sorted(files))
+
+    for key, entry in list(manifest.entries.items()):
+        files = entry.get("files", [])
+        if any(not os.path.exists(os.path.join(BASE_OUTPUT_DIR, f)) and f not in cataloged for f in files):
+            manifest.forget(key)
+
+def plan_year_batches(start_date=START_DATE, end_date=END_DATE):
+    """
+    Splits the date range into calendar years and keeps the years that still have
+    days missing from bronze. The DAG maps one download task over each batch.
+    """
+    manifest = WindowManifest(BASE_OUTPUT_DIR)
+    sync_manifest(manifest)
+    done_dates = manifest.covered_dates(AREA)
+
+    start_date, end_date = to_date(start_date), to_date(end_date)
+    batches = []
+    for year in range(start_date.year, end_date.year + 1):
+        first = max(start_date, start_date.replace(year=year, month=1, day=1))
+        last = min(end_date, end_date.replace(year=year, month=12, day=31))
+        if plan_windows(first, last, MAX_DAYS_PER_REQUEST, done_dates):
+            batches.append({"start": first.isoformat(), "end": last.isoformat()})
+    return batches
+
+def fetch_raw_fire_data(start_date=START_DATE, end_date=END_DATE, days_per_request=DAYS_PER_REQUEST,
+                        requests_per_minute=REQUESTS_PER_MINUTE, stream=STREAM_MODE):
+    """
+    Downloads every window of the range that is not in bronze yet.
+    requests_per_minute is this call's share of the API quota (parallel DAG tasks split it).
+    stream also loads each window into Postgres and S3 while it is parsed (stream_handoff.py).
+    Returns {"windows", "bytes", "rows"} for the new windows; any failed window raises.
+    """
     if not API_KEY:
-        print("CRITICAL ERROR: NASA_API_KEY not found.")
-        return
+        raise RuntimeError("NASA_API_KEY not found.")
 
-    print(f"--- Starting Raw Data Ingestion: Global Fires ({START_YEAR}-{END_YEAR}) ---")
+    print(f"--- Starting Raw Data Ingestion: Global Fires ({start_date} to {end_date}) ---")
     print(f"Storage Path: {BASE_OUTPUT_DIR}")
 
-    total_files = 0
-    
-    # Loop through every year
-    for year in range(START_YEAR, END_YEAR + 1):
-        # Create a sub-folder for this year (e.g., data/bronze/fires/2000)
-        year_dir = os.path.join(BASE_OUTPUT_DIR, str(year))
-        os.makedirs(year_dir, exist_ok=True)
-
-        # Target Date: Peak Fire Season (August 1st)
-        # Grab the full 24-hour window for the whole planet
-        target_date = f"{year}-08-01"
-        
-        # Define the output filename
-        file_name = f"fires_world_{target_date}.csv"
-        file_path = os.path.join(year_dir, file_name)
-        
-        # Check if file already exists (Don't re-download if we have it)
-        if os.path.exists(file_path):
-            print(f"[SKIP] {year}: File already exists.")
-            continue
-
-        # Construct API URL
-        url = f"https://firms.modaps.eosdis.nasa.gov/api/area/csv/{API_KEY}/{SOURCE}/{AREA}/1/{target_date}"
-        
-        try:
-            print(f"Downloading {target_date}...", end=" ", flush=True)
-            
-            # Request data (Stream it to handle large files efficiently)
-            with requests.get(url, stream=True, timeout=120) as r:
-                r.raise_for_status()
-                
-                # Check if API returned an error message instead of CSV
-                if "Map Key not found" in r.text:
-                    print("\n[ERROR] Invalid API Key.")
-                    break
-                
-                # Write the raw content to disk
-                with open(file_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-            
-            # Verify file size (Empty files usually mean no data or error)
-            file_size_kb = os.path.getsize(file_path) / 1024
-            print(f"-> Saved ({file_size_kb:.1f} KB)")
-            total_files += 1
-
-            # Wait 2 seconds between heavy requests
-            time.sleep(2)
-
-        except Exception as e:
-            print(f"\n[FAILED] {year}: {e}")
-
-    print(f"\n--- Job Complete. Downloaded {total_files} new files. ---")
+    # 1. Plan API windows over the days that are not in the manifest yet
+    manifest = WindowManifest(BASE_OUTPUT_DIR)
+    sync_manifest(manifest)
+    done_dates = manifest.covered_dates(AREA)
+    windows = plan_windows(start_date, end_date, days_per_request, done_dates)
+
+    jobs = []
+    for window_start, days in windows:
+        key = window_key(AREA, window_start, days)
+        file_path = window_path(BASE_OUTPUT_DIR, AREA, window_start, days, extension=BRONZE_FORMAT)
+        url = area_url(API_KEY, SOURCE, AREA, days, window_start.isoformat())
+        jobs.append((key, url, file_path))
+
+    print(f"Planned {len(windows)} windows ({len(done_dates)} days already on disk).")
+
+    if not jobs:
+        print("\n--- Job Complete. Nothing new to download. ---")
+        return {"windows": 0, "bytes": 0, "rows": 0}
+
+    # 2. Download concurrently. The token bucket inside FirmsClient paces the
+    # requests to the API quota, so there are no fixed sleeps between files.
+    print(f"Downloading {len(jobs)} windows with {MAX_WORKERS} workers ({BRONZE_FORMAT})...")
+    start = time.perf_counter()
+
+    def to_parquet(stream, file_path):
+        # Parse the response as it arrives straight into year=/month= Parquet files
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        return stream_csv_to_parquet(stream, BASE_OUTPUT_DIR, stem)
+
+    def record(result):
+        # Mark each window as soon as it lands so a retry resumes from here
+        if result["error"]:
+            print(f"[FAILED] {result['label']}: {result['error']}")
+            return
+        files = result.get("files", [result["file_path"]])
+        count("bytes_downloaded", result["bytes"])
+        count("rows_parsed", result.get("rows") or 0)
+        manifest.mark_done(result["label"], bytes=result["bytes"], rows=result.get("rows"),
+                           files=[os.path.relpath(f, BASE_OUTPUT_DIR) for f in files])
+        print(f" -> {result['label']} saved ({result['bytes'] / 1024:.1f} KB in {result['seconds']:.1f}s)")
+
+    sink = to_parquet if BRONZE_FORMAT == "parquet" else None
+    handoff = None
+    if stream and BRONZE_FORMAT == "parquet":
+        handoff = StreamHandoff(BASE_OUTPUT_DIR, pool_size=MAX_WORKERS)
+        sink = handoff.sink
+    elif stream:
+        print("[WARN] Streaming hand-off needs FIRE_BRONZE_FORMAT=parquet; writing CSV only.")
+
+    # An invalid API key raises out of here and fails the task
+    try:
+        with FirmsClient(requests_per_minute=requests_per_minute) as client:
+            results = client.download_many(jobs, on_result=record, sink=sink)
+            print(f"HTTP cache: {client.cache.summary()}")
+    finally:
+        if handoff:
+            handoff.close()
+
+    ok = [r for r in results if not r["error"]]
+    total_bytes = sum(r["bytes"] for r in ok)
+    elapsed = time.perf_counter() - start
+    print(f"\n--- Job Complete. Downloaded {len(ok)} new windows "
+          f"({total_bytes / 1024 / 1024:.1f} MB in {elapsed:.1f}s), {len(results) - len(ok)} failed. ---")
+
+    # Finished windows are already in the manifest, so a retry only redoes the failed ones
+    if len(ok) < len(results):
+        raise RuntimeError(f"{len(results) - len(ok)} of {len(results)} windows failed to download.")
+
+    return {"windows": len(ok), "bytes": total_bytes, "rows": sum(r.get("rows") or 0 for r in ok)}
 
 if __name__ == "__main__":
-    fetch_raw_fire_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Download raw FIRMS fire detections into the bronze layer.")
+    parser.add_argument("--start", default=START_DATE, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--end", default=END_DATE, help="Last day (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=DAYS_PER_REQUEST, help="Days per API request (1-10)")
+    parser.add_argument("--stream", action="store_true", default=STREAM_MODE,
+                        help="Also COPY into Postgres and upload to S3 while parsing (Parquet bronze only)")
+    args = parser.parse_args()
+
+    with run_stage("fetch_fire_raw"):
+        fetch_raw_fire_data(args.start, args.end, args.days, stream=args.stream)
@@ -8,67 +8,193 @@
 
 
 
-import requests  # Library to send HTTP requests (like a browser)
-import pandas as pd
+import csv
+import io
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from http_cache import HttpCache  # On-disk HTTP cache (conditional requests, offline replay)
+from instrumentation import count, run_stage, span
 
 # --- CONFIGURATION ---
 # The URL for NASA's Global Surface Temperature Analysis (GISTEMP v4)
 # "Ts+dSST" means Surface Air Temperature + Sea Surface Temperature.
-DATA_URL = "https://data.giss.nasa.gov/gistemp/tabledata_v4/GLB.Ts+dSST.csv"
+DATA_URL = os.getenv("GISTEMP_URL", "https://data.giss.nasa.gov/gistemp/tabledata_v4/GLB.Ts+dSST.csv")
+# The other tables are published next to the global one
+GISTEMP_BASE_URL = os.getenv("GISTEMP_BASE_URL", DATA_URL.rsplit("/", 1)[0])
+
+# dataset -> (file name, layout)
+#  - "monthly": one row per year, Jan..Dec plus the annual J-D mean
+#  - "zonal": one row per year, the annual mean of every latitude band
+DATASETS = {
+    "global": ("GLB.Ts+dSST.csv", "monthly"),
+    "NH": ("NH.Ts+dSST.csv", "monthly"),
+    "SH": ("SH.Ts+dSST.csv", "monthly"),
+    "zonal": ("ZonAnn.Ts+dSST.csv", "zonal"),
+}
+CLIMATE_DATASETS = [name.strip() for name in os.getenv("GISTEMP_DATASETS", ",".join(DATASETS)).split(",")
+                    if name.strip()]
+# The tables are small; they are fetched side by side so the slowest one sets the pace
+FETCH_WORKERS = int(os.getenv("GISTEMP_FETCH_WORKERS", str(len(DATASETS))))
 
-OUTPUT_DIR = "/opt/airflow/data" 
+OUTPUT_DIR = os.getenv("PIPELINE_DATA_DIR", "/opt/airflow/data")
 RAW_FILE = os.path.join(OUTPUT_DIR, "global_temps_raw.csv")
+# Global annual series (year, temp_anomaly_celsius), as raw_temperatures and the gold engines read it
 CLEAN_FILE = os.path.join(OUTPUT_DIR, "global_temps_clean.csv")
+# Every dataset in long format (dataset, series, year, month, anomaly_celsius); month 0 = annual mean
+SERIES_FILE = os.path.join(OUTPUT_DIR, "climate_series_clean.csv")
+SERIES_COLUMNS = ["dataset", "series", "year", "month", "anomaly_celsius"]
 
-def fetch_temperature_data():
-    """
-    Downloads and cleans global temperature anomaly data.
-     - Fetches the CSV data from NASA's GISTEMP.
-     - Saves the raw CSV to disk.
-     - Cleans the data by removing metadata rows and converting to numeric.
-     - Saves the cleaned data to disk.
-     - Returns the cleaned DataFrame.
-    """
+# Seconds to wait for NASA before giving up (the old request could hang forever)
+REQUEST_TIMEOUT = int(os.getenv("GISTEMP_TIMEOUT", "60"))
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+ANNUAL = 0
+GLOBAL_SERIES = "global"
+# Columns of the zonal table that duplicate the global and hemispheric tables
+ZONAL_SKIP = {"Year", "Glob", "NHem", "SHem"}
+
+
+class ClimatePoint(NamedTuple):
+    dataset: str
+    series: str
+    year: int
+    month: int  # 1-12, 0 = annual mean
+    anomaly_celsius: float
+
+
+def dataset_url(name):
+    file_name = DATASETS[name][0]
+    return DATA_URL if name == GLOBAL_SERIES else f"{GISTEMP_BASE_URL}/{file_name}"
+
+
+def raw_path(name):
+    return RAW_FILE if name == GLOBAL_SERIES else os.path.join(OUTPUT_DIR, f"gistemp_{name.lower()}_raw.csv")
+
+
+def parse_anomaly(text):
+    """A table cell as a float; GISTEMP marks missing months with '***'."""
     try:
-        # Step 1: Fetch the data from NASA
-        print("Fetching temperature data from NASA...")
-        response = requests.get(DATA_URL)
-        response.raise_for_status()  # Check if the request was successful
-
-        # Step 2: Save the raw CSV to disk
-        with open(RAW_FILE, "w") as f:
-            f.write(response.text)
-        print(f"Raw data saved to {RAW_FILE}")
-
-    except Exception as e:
-        print(f"Error fetching data: {e}")
+        return float(text)
+    except ValueError:
         return None
 
-    # Step 3: Load the CSV into a DataFrame and clean it
-    try:
-        # 1. Read the CSV into a Pandas DataFrame
-        print("Cleaning the data...")
-        df = pd.read_csv(RAW_FILE, skiprows=1)  # Skip the first row of metadata
-        # 2. Filter Columns: Keep only 'Year' and 'J-D' (January to December average)
-        clean_df = df[["Year", "J-D"]]
-        # 3. Rename Columns for clarity
-        clean_df.rename(columns={"Year": "year", "J-D": "temp_anomaly_celsius"}, inplace=True)
-        # 4. Convert 'temp_anomaly_celsius' to numeric, coercing errors to NaN
-        clean_df["temp_anomaly_celsius"] = pd.to_numeric(clean_df["temp_anomaly_celsius"], errors="coerce")
-        # 5. Drop rows with NaN values
-        clean_df.dropna(inplace=True)
-        # 6. Save the cleaned data to disk
-        clean_df.to_csv(CLEAN_FILE, index=False)
-        print(f"Cleaned data saved to {CLEAN_FILE}")
-        print("First 5 rows of cleaned data:")
-        print(clean_df.head())
-
-    except Exception as e:
-        print(f"Error processing data: {e}")
-        return None    
 
-if __name__ == "__main__":
+def table_rows(body):
+    """Yields {column: cell} for every year of a GISTEMP table (title lines above the header skipped)."""
+    header = None
+    for row in csv.reader(io.StringIO(body.decode("utf-8-sig"))):
+        cells = [cell.strip() for cell in row]
+        if header is None:
+            if cells and cells[0] == "Year":
+                header = cells
+        elif cells and cells[0].isdigit():
+            yield dict(zip(header, cells))
+    if header is None:
+        raise ValueError("no 'Year' header line found")
+
+
+def parse_table(name, body):
+    """The points of one downloaded table, parsed straight from memory."""
+    layout = DATASETS[name][1]
+    points = []
+    for row in table_rows(body):
+        year = int(row["Year"])
+        if layout == "monthly":
+            cells = [(month, row.get(label, "")) for month, label in enumerate(MONTHS, start=1)]
+            cells.append((ANNUAL, row.get("J-D", "")))
+            points.extend(ClimatePoint(name, name, year, month, value) for month, value in
+                          ((month, parse_anomaly(cell)) for month, cell in cells) if value is not None)
+        else:
+            for column, cell in row.items():
+                value = parse_anomaly(cell)
+                if column not in ZONAL_SKIP and value is not None:
+                    points.append(ClimatePoint(name, column, year, ANNUAL, value))
+    return points
+
+
+def read_series_file(path=SERIES_FILE):
+    """The points of the last successful fetch, [] if there is none."""
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="") as f:
+        return [ClimatePoint(row["dataset"], row["series"], int(row["year"]), int(row["month"]),
+                             float(row["anomaly_celsius"])) for row in csv.DictReader(f)]
+
+
+def write_csv(path, header, rows):
+    """Writes a small CSV atomically (readers never see half a file)."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+
+def fetch_temperature_data(datasets=CLIMATE_DATASETS, workers=FETCH_WORKERS):
+    """
+    Downloads and cleans the GISTEMP temperature anomaly tables.
+     - Fetches the global, hemispheric and zonal tables concurrently, through the
+       HTTP cache (an unchanged table is not downloaded again).
+     - Keeps a raw copy of each table and parses it from memory, never from disk.
+     - Writes every monthly and annual value in long format to SERIES_FILE, and
+       the global annual series to CLEAN_FILE.
+     - Returns the points (ClimatePoint) now in SERIES_FILE.
+    A table that fails keeps the points of the last successful run, so the others
+    are not lost; the failure is raised at the end and a retry only re-downloads
+    what the cache does not hold yet.
+    """
+    unknown = sorted(set(datasets) - set(DATASETS))
+    if unknown:
+        raise ValueError(f"Unknown GISTEMP datasets {unknown} (expected some of {list(DATASETS)})")
+
+    print(f"Fetching temperature data from NASA ({', '.join(datasets)})...")
     os.makedirs(OUTPUT_DIR, exist_ok=True)  # Ensure the output directory exists
+    cache = HttpCache(timeout=REQUEST_TIMEOUT)
+
+    def fetch(name):
+        with cache.open(dataset_url(name)) as body:
+            data = body.read()
+        count("bytes_downloaded", len(data))
+        with open(raw_path(name), "wb") as f:
+            f.write(data)
+        points = parse_table(name, data)
+        if not points:
+            raise ValueError(f"{DATASETS[name][0]} holds no values")
+        return points
+
+    fetched, errors = {}, []
+    with span("download"), ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {name: pool.submit(fetch, name) for name in datasets}
+        for name, future in futures.items():
+            try:
+                fetched[name] = future.result()
+                print(f"  {name}: {len(fetched[name])} values from {DATASETS[name][0]}")
+            except Exception as e:
+                print(f"Error fetching {name} ({dataset_url(name)}): {e}")
+                errors.append(f"{name}: {e}")
+    print(f"HTTP cache: {cache.summary()}")
 
-    fetch_temperature_data()
\ No newline at end of file
+    with span("clean"):
+        kept = [point for point in read_series_file() if point.dataset in datasets and point.dataset not in fetched]
+        points = sorted(kept + [point for name in datasets for point in fetched.get(name, [])])
+        count("rows_parsed", len(points))
+        write_csv(SERIES_FILE, SERIES_COLUMNS, points)
+        print(f"{len(points)} monthly/annual values saved to {SERIES_FILE}")
+
+        annual = [(point.year, point.anomaly_celsius) for point in points
+                  if point.series == GLOBAL_SERIES and point.month == ANNUAL]
+        if annual:
+            write_csv(CLEAN_FILE, ["year", "temp_anomaly_celsius"], annual)
+            print(f"Global annual series ({len(annual)} years, {annual[0][0]}-{annual[-1][0]}) "
+                  f"saved to {CLEAN_FILE}")
+
+    if errors:
+        raise RuntimeError(f"GISTEMP fetch failed ({'; '.join(errors)})")
+    return points
+
+if __name__ == "__main__":
+    with run_stage("fetch_temperature"):
+        fetch_temperature_data()
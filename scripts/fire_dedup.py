@@ -0,0 +1,165 @@
+import os
+from datetime import date
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# --- CONFIGURATION ---
+# Overlapping windows, or a mix of sources (MODIS_SP + NRT, ...), deliver the same
+# detection several times. A detection is identified by
+#   (rounded latitude, rounded longitude, acq_date, acq_time, satellite)
+# acq_date is the partition key of raw_fires, so it is kept as fire_date and the
+# rest is packed into one BIGINT dedup_key; raw_fires is unique on (fire_date, dedup_key).
+DEDUP_ENABLED = os.getenv("FIRE_DEDUP", "true").lower() in ("1", "true", "yes")
+
+# Coordinates are compared at this many decimals (3 = ~110 m, finer than a MODIS
+# or VIIRS pixel). Up to 4, the key is an exact packing with no collisions.
+COORD_DECIMALS = int(os.getenv("FIRE_DEDUP_DECIMALS", "3"))
+
+# Memory for the keys the streaming filter remembers (8 bytes each). Beyond it the
+# oldest days are forgotten; the unique index still catches what the filter missed.
+DEDUP_MEMORY_MB = float(os.getenv("FIRE_DEDUP_MEMORY_MB", "128"))
+
+KEY_COLUMNS = ["latitude", "longitude", "acq_date", "acq_time", "satellite"]
+# The filter keys days as date32 values: days since this date
+EPOCH = date(1970, 1, 1)
+
+# dedup_key layout (63 bits, always a positive BIGINT):
+#   satellite (8) | acq_time HHMM (12) | latitude (21) | longitude (22)
+LAT_BITS, LON_BITS, TIME_BITS = 21, 22, 12
+NULL_TIME = (1 << TIME_BITS) - 1
+
+# The same satellite is spelled differently across FIRMS products
+SATELLITE_ALIASES = {
+    "terra": "terra", "t": "terra",
+    "aqua": "aqua", "a": "aqua",
+    "n": "suomi-npp", "npp": "suomi-npp", "suomi npp": "suomi-npp", "suomi-npp": "suomi-npp",
+    "1": "noaa-20", "n20": "noaa-20", "noaa-20": "noaa-20", "noaa20": "noaa-20",
+    "2": "noaa-21", "n21": "noaa-21", "noaa-21": "noaa-21", "noaa21": "noaa-21",
+}
+SATELLITE_CODES = {name: code for code, name in enumerate(["terra", "aqua", "suomi-npp", "noaa-20", "noaa-21"], 1)}
+UNKNOWN_SATELLITE = 255
+
+if not 0 <= COORD_DECIMALS <= 4:
+    raise ValueError(f"FIRE_DEDUP_DECIMALS must be between 0 and 4, got {COORD_DECIMALS}")
+
+
+def satellite_codes(satellites):
+    """Small integer per row (0 = missing) from the satellite names, via their dictionary."""
+    encoded = pc.dictionary_encode(pc.utf8_lower(pc.utf8_trim_whitespace(satellites.cast(pa.string()))))
+    if isinstance(encoded, pa.ChunkedArray):
+        encoded = encoded.combine_chunks()
+    codes = np.array([SATELLITE_CODES.get(SATELLITE_ALIASES.get(name, name), UNKNOWN_SATELLITE)
+                      for name in encoded.dictionary.to_pylist()] or [0], dtype=np.int64)
+    indices = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+    return np.where(indices >= 0, codes[np.maximum(indices, 0)], 0)
+
+
+def rounded_offsets(values, limit, bits):
+    """Coordinates rounded to COORD_DECIMALS, shifted to non-negative integers below 2**bits."""
+    scale = 10 ** COORD_DECIMALS
+    values = values.to_numpy(zero_copy_only=False).astype(np.float64)
+    offsets = np.rint((np.nan_to_num(values, nan=0.0) + limit) * scale).astype(np.int64)
+    return np.clip(offsets, 0, (1 << bits) - 1)
+
+
+def dedup_keys(batch):
+    """BIGINT dedup_key of every row of a batch holding KEY_COLUMNS (acq_date excluded, see above)."""
+    times = batch.column("acq_time").cast(pa.int64()).fill_null(NULL_TIME).to_numpy(zero_copy_only=False)
+    times = np.clip(times, 0, NULL_TIME)
+    return ((satellite_codes(batch.column("satellite")) << (TIME_BITS + LAT_BITS + LON_BITS))
+            | (times << (LAT_BITS + LON_BITS))
+            | (rounded_offsets(batch.column("latitude"), 90.0, LAT_BITS) << LON_BITS)
+            | rounded_offsets(batch.column("longitude"), 180.0, LON_BITS))
+
+
+def dedup_key_sql():
+    """
+    dedup_keys() as a DuckDB SQL expression over the KEY_COLUMNS, so a SQL scan of
+    bronze keys rows itself (same packing; round_even rounds like NumPy's rint).
+    """
+    names = {**{name: name for name in SATELLITE_CODES}, **SATELLITE_ALIASES}
+    satellite = ("CASE WHEN satellite IS NULL THEN 0 ELSE CASE lower(trim(satellite::VARCHAR)) "
+                 + " ".join(f"WHEN '{name}' THEN {SATELLITE_CODES[code]}" for name, code in sorted(names.items()))
+                 + f" ELSE {UNKNOWN_SATELLITE} END END")
+    times = f"least(greatest(coalesce(acq_time::BIGINT, {NULL_TIME}), 0), {NULL_TIME})"
+
+    def offset(column, limit, bits):
+        value = f"CASE WHEN {column} IS NULL OR isnan({column}::DOUBLE) THEN 0 ELSE {column}::DOUBLE END"
+        rounded = f"round_even(({value} + {limit}) * {10 ** COORD_DECIMALS}, 0)::BIGINT"
+        return f"least(greatest({rounded}, 0), {(1 << bits) - 1})"
+
+    return (f"((({satellite})::BIGINT << {TIME_BITS + LAT_BITS + LON_BITS})"
+            f" | ({times} << {LAT_BITS + LON_BITS})"
+            f" | ({offset('latitude', 90.0, LAT_BITS)} << {LON_BITS})"
+            f" | {offset('longitude', 180.0, LON_BITS)})")
+
+
+class DedupFilter:
+    """
+    Streaming filter over (acq_date, dedup_key): a row is kept the first time it is
+    seen. Keys are remembered per day in sorted arrays; once they exceed memory_mb
+    the oldest days are dropped (windows arrive roughly in date order).
+    memory_mb=None never drops a day on its own: the reader calls forget_before()
+    instead, when no file still to come can hold the earlier days (exact counts).
+    """
+
+    def __init__(self, memory_mb=DEDUP_MEMORY_MB):
+        self.max_keys = max(1, int(memory_mb * 1024 * 1024 / 8)) if memory_mb is not None else None
+        self.seen = {}
+        self.size = 0
+        self.dropped = 0
+
+    def keep_mask(self, days, keys):
+        """Boolean mask of the rows not seen before (duplicates within the batch included)."""
+        keep = np.zeros(len(keys), dtype=bool)
+        for day in np.unique(days):
+            rows = np.flatnonzero(days == day)
+            unique_keys, first = np.unique(keys[rows], return_index=True)
+            seen = self.seen.get(day)
+            if seen is not None:
+                new = ~np.isin(unique_keys, seen, assume_unique=True)
+                unique_keys, first = unique_keys[new], first[new]
+                self.seen[day] = np.union1d(seen, unique_keys)
+            else:
+                self.seen[day] = unique_keys
+            keep[rows[first]] = True
+            self.size += len(unique_keys)
+
+        self.dropped += len(keys) - int(keep.sum())
+        self._evict()
+        return keep
+
+    def forget_before(self, day):
+        """Drops the keys of the days before `day` (a date)."""
+        cutoff = (day - EPOCH).days
+        for old in [d for d in self.seen if d < cutoff]:
+            self.size -= len(self.seen.pop(old))
+
+    def _evict(self):
+        if self.max_keys is None:
+            return
+        while self.size > self.max_keys and len(self.seen) > 1:
+            oldest = min(self.seen)
+            self.size -= len(self.seen.pop(oldest))
+
+
+def with_dedup_keys(batch, columns, dedup_filter=None):
+    """
+    `columns` of a batch (that also holds KEY_COLUMNS) plus its dedup_key column.
+    With a DedupFilter, rows it has already seen are dropped.
+    """
+    arrays = [batch.column(name) for name in columns]
+    if not DEDUP_ENABLED:
+        return pa.RecordBatch.from_arrays(arrays + [pa.nulls(batch.num_rows, pa.int64())],
+                                          names=list(columns) + ["dedup_key"])
+
+    keys = dedup_keys(batch)
+    result = pa.RecordBatch.from_arrays(arrays + [pa.array(keys, pa.int64())], names=list(columns) + ["dedup_key"])
+    if dedup_filter is None:
+        return result
+
+    days = batch.column("acq_date").cast(pa.int32()).fill_null(-1).to_numpy(zero_copy_only=False)
+    keep = dedup_filter.keep_mask(days, keys)
+    return result if keep.all() else result.filter(pa.array(keep))
@@ -0,0 +1,286 @@
+import io
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from http_cache import HttpCache
+from instrumentation import span
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+# Every setting can be overridden from the environment (.env) so the engine can be
+# tuned to the FIRMS quota of a given MAP_KEY, or pointed at a local stub server.
+FIRMS_BASE_URL = os.getenv("FIRMS_BASE_URL", "https://firms.modaps.eosdis.nasa.gov")
+
+# How many downloads may be in flight at the same time
+MAX_WORKERS = int(os.getenv("FIRMS_MAX_WORKERS", "4"))
+
+# Token bucket: FIRMS allows 5000 transactions per 10 minutes per MAP_KEY, but a
+# global Area request is "heavy" and counts as many transactions, so we default low.
+REQUESTS_PER_MINUTE = float(os.getenv("FIRMS_REQUESTS_PER_MINUTE", "30"))
+BURST = int(os.getenv("FIRMS_BURST", "4"))
+
+# Exponential backoff for 429 (rate limited) and 5xx (NASA overloaded) responses
+MAX_RETRIES = int(os.getenv("FIRMS_MAX_RETRIES", "5"))
+BACKOFF_SECONDS = float(os.getenv("FIRMS_BACKOFF_SECONDS", "2"))
+MAX_BACKOFF_SECONDS = float(os.getenv("FIRMS_MAX_BACKOFF_SECONDS", "120"))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+REQUEST_TIMEOUT = int(os.getenv("FIRMS_TIMEOUT", "120"))
+CHUNK_SIZE = 64 * 1024
+
+# FIRMS answers with HTTP 200 and a plain text message when the key is wrong
+INVALID_KEY_MARKERS = (b"Map Key not found", b"Invalid MAP_KEY")
+
+
+class InvalidApiKeyError(Exception):
+    """Raised when FIRMS rejects the MAP_KEY. Retrying will never help."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+     - Tokens refill continuously at `rate` per second up to `capacity`.
+     - acquire() blocks until a token is available, so callers never need fixed sleeps.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def build_session(pool_size=MAX_WORKERS):
+    """
+    Creates one pooled HTTP session that all worker threads share.
+    Keep-alive connections are reused instead of doing a TLS handshake per request.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def area_url(api_key, source, area, days, date, base_url=None):
+    # URL Format: /api/area/csv/[KEY]/[SOURCE]/[AREA]/[DAYS]/[DATE]
+    base_url = base_url or FIRMS_BASE_URL
+    return f"{base_url}/api/area/csv/{api_key}/{source}/{area}/{days}/{date}"
+
+
+class FirmsClient:
+    """
+    Bounded-concurrency download engine for the FIRMS Area API.
+     - One pooled requests.Session reused across all requests.
+     - A shared TokenBucket limits the request rate to the key's quota.
+     - 429/5xx responses are retried with exponential backoff (honoring Retry-After).
+     - Responses go through the shared HttpCache, so a window that is already
+       cached costs neither a request nor a rate-limit token.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, requests_per_minute=REQUESTS_PER_MINUTE,
+                 burst=BURST, max_retries=MAX_RETRIES, backoff_seconds=BACKOFF_SECONDS,
+                 timeout=REQUEST_TIMEOUT, session=None, cache=None):
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.session = session or build_session(self.max_workers)
+        self.limiter = TokenBucket(requests_per_minute / 60.0, burst)
+        self.cache = cache or HttpCache(timeout=timeout)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _backoff_delay(self, attempt, response=None):
+        # Respect the server's Retry-After header when it gives us one
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(MAX_BACKOFF_SECONDS, float(retry_after))
+
+        delay = self.backoff_seconds * (2 ** attempt)
+        # Jitter stops all workers from retrying at the exact same moment
+        return min(MAX_BACKOFF_SECONDS, delay + random.uniform(0, self.backoff_seconds))
+
+    def get(self, url, stream=False, headers=None):
+        """
+        Rate-limited GET with retries. The caller owns (and must close) the response.
+        """
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                response = self.session.get(url, stream=stream, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self._backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._backoff_delay(attempt, response)
+                response.close()
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            response.raise_for_status()
+            return response
+
+    @contextmanager
+    def open_stream(self, url):
+        """
+        Opens a rate-limited, retried GET (or a cached body) and yields a read-only
+        file-like stream over the (decompressed) body, e.g. for an incremental CSV parser.
+        """
+        def conditional_get(url, headers):
+            return self.get(url, stream=True, headers=headers)
+
+        with self.cache.open(url, conditional_get) as body:
+            head = body.read(CHUNK_SIZE) or b""
+
+            # Check if API returned an error message instead of CSV
+            # (raising here also keeps the message out of the cache)
+            if any(marker in head for marker in INVALID_KEY_MARKERS):
+                raise InvalidApiKeyError("FIRMS rejected the NASA_API_KEY (MAP_KEY).")
+
+            yield ResponseStream(head, body)
+
+    def download_to_file(self, url, file_path):
+        """
+        Streams one response to disk and returns the number of bytes written.
+        """
+        with self.open_stream(url) as stream:
+            return write_raw_file(stream, file_path)
+
+    def download_many(self, jobs, on_result=None, sink=None):
+        """
+        Downloads many (label, url, file_path) jobs concurrently.
+         - sink(stream, file_path) consumes each response body and returns a dict
+           of extra result fields. The default writes the raw bytes to file_path.
+         - on_result(result) is called as each job finishes (e.g. to update a manifest).
+        Returns a list of result dicts: {label, file_path, bytes, seconds, error, ...}.
+        An invalid API key cancels everything that has not started yet.
+        """
+        results = []
+        if not jobs:
+            return results
+
+        sink = sink or write_raw_file
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._timed_download, url, path, sink): (label, path)
+                       for label, url, path in jobs}
+
+            for future in as_completed(futures):
+                label, path = futures[future]
+                result = {"label": label, "file_path": path, "bytes": 0, "seconds": 0.0, "error": None}
+                try:
+                    result.update(future.result())
+                except InvalidApiKeyError as e:
+                    for other in futures:
+                        other.cancel()
+                    raise e
+                except Exception as e:
+                    result["error"] = str(e)
+
+                results.append(result)
+                if on_result:
+                    on_result(result)
+
+        return results
+
+    def _timed_download(self, url, file_path, sink):
+        start = time.perf_counter()
+        with span("download", file=os.path.basename(file_path)), self.open_stream(url) as stream:
+            info = sink(stream, file_path) or {}
+            info.setdefault("bytes", stream.bytes_read)
+        info["seconds"] = time.perf_counter() - start
+        return info
+
+
+class ResponseStream(io.RawIOBase):
+    """
+    Minimal read-only file object over a streamed HTTP body.
+    Replays the bytes already peeked at, then reads from the socket.
+    """
+
+    def __init__(self, head, raw):
+        self.head = head
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # Lets io.BufferedReader / TextIOWrapper wrap the stream for line reading
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def read(self, size=-1):
+        if self.head:
+            if size is None or size < 0:
+                data = self.head + self.raw.read()
+                self.head = b""
+            else:
+                data, self.head = self.head[:size], self.head[size:]
+        else:
+            data = self.raw.read() if size is None or size < 0 else self.raw.read(size)
+        data = data or b""
+        self.bytes_read += len(data)
+        return data
+
+
+def write_raw_file(stream, file_path):
+    """
+    Copies a stream to disk and returns {"bytes": n}.
+    Data goes to a .part file first so an interrupted download is never
+    mistaken for a finished one on the next run.
+    """
+    tmp_path = file_path + ".part"
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    bytes_written = 0
+    with open(tmp_path, "wb") as f:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            f.write(chunk)
+            bytes_written += len(chunk)
+
+    os.replace(tmp_path, file_path)
+    return {"bytes": bytes_written}
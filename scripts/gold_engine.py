@@ -0,0 +1,257 @@
+import os
+import re
+import time
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from bronze_reader import iter_bronze_batches
+from date_windows import earliest_day
+from fetch_fire_raw import bronze_read_files
+from fire_dedup import DEDUP_ENABLED, KEY_COLUMNS, DedupFilter, dedup_key_sql, with_dedup_keys
+from instrumentation import count, span
+from pg_copy import LOAD_COLUMN_TYPES
+
+# --- CONFIGURATION ---
+# Where the gold annual summary is computed:
+#  - "postgres" (default): SQL over raw_fires after the load (transform_data.py)
+#  - "duckdb": DuckDB straight over the bronze Parquet/CSV files, no database needed
+#  - "arrow":  the same with Arrow compute only (also the fallback when duckdb is missing)
+GOLD_ENGINE = os.getenv("GOLD_ENGINE", "postgres").lower()
+LOCAL_ENGINES = ("duckdb", "arrow")
+
+DATA_DIR = os.getenv("PIPELINE_DATA_DIR", "/opt/airflow/data")
+TEMP_FILE = os.path.join(DATA_DIR, "global_temps_clean.csv")
+
+# Same window as ANNUAL_SUMMARY_SQL (WHERE t.year >= 2000)
+FIRST_YEAR = int(os.getenv("GOLD_FIRST_YEAR", "2000"))
+
+# DuckDB threads / memory (DuckDB spills to disk beyond the limit)
+DUCKDB_THREADS = int(os.getenv("GOLD_DUCKDB_THREADS", str(os.cpu_count() or 1)))
+DUCKDB_MEMORY_LIMIT = os.getenv("GOLD_DUCKDB_MEMORY_LIMIT", "1GB")
+
+SUMMARY_COLUMNS = ["year", "temp_anomaly_celsius", "total_fires", "avg_intensity", "max_intensity"]
+
+# raw_fires holds each detection once (fire_dedup.py), so the local engines count
+# it once too: they also read the dedup_key columns (the Arrow engine with the
+# loader's column types, so the keys match). FIRE_DEDUP=false counts every bronze
+# row, like the load.
+FIRE_COLUMNS = KEY_COLUMNS + ["frp"]
+
+# The annual_global_summary query, over bronze files instead of raw_fires.
+# Only the needed columns are read (projection pushdown), and the year filter prunes
+# hive partitions (year=YYYY) and Parquet row groups by their min/max statistics.
+DUCKDB_SUMMARY_SQL = """
+WITH fires AS (
+    {fire_sources}
+),
+fire_stats AS (
+    SELECT
+        year(acq_date) AS year,
+        COUNT(*) AS total_fires,
+        AVG(frp) AS avg_intensity,
+        MAX(frp)::DOUBLE AS max_intensity
+    FROM fires
+    GROUP BY 1
+),
+temp_stats AS (
+    SELECT year, temp_anomaly_celsius
+    FROM read_csv(?, header = true, columns = {{'year': 'INTEGER', 'temp_anomaly_celsius': 'DOUBLE'}})
+)
+SELECT
+    t.year,
+    t.temp_anomaly_celsius,
+    COALESCE(f.total_fires, 0) AS total_fires,
+    COALESCE(f.avg_intensity, 0) AS avg_intensity,
+    COALESCE(f.max_intensity, 0) AS max_intensity
+FROM temp_stats t
+LEFT JOIN fire_stats f ON t.year = f.year
+WHERE t.year >= ?
+ORDER BY t.year DESC
+"""
+
+# {key} is ", <dedup_key expression> AS dedup_key" with FIRE_DEDUP on, else empty
+PARQUET_SOURCE_SQL = """
+    SELECT acq_date, frp{key} FROM read_parquet(?, hive_partitioning = true)
+    WHERE year >= ? AND acq_date >= ?"""
+
+CSV_SOURCE_SQL = """
+    SELECT acq_date, frp{key} FROM read_csv(?, header = true, union_by_name = true,
+                                            types = {{'acq_date': 'DATE', 'frp': 'FLOAT', 'latitude': 'DOUBLE',
+                                                     'longitude': 'DOUBLE', 'acq_time': 'INTEGER',
+                                                     'satellite': 'VARCHAR'}})
+    WHERE acq_date >= ?"""
+
+# One row per (acq_date, dedup_key), like the UNIQUE constraint of raw_fires
+DEDUP_SOURCE_SQL = """
+    SELECT acq_date, first(frp) AS frp FROM (
+    {sources}
+    ) keyed
+    GROUP BY acq_date, dedup_key"""
+
+
+def bronze_files_by_format():
+    """Bronze files split into (parquet, csv); each window counted once (see bronze_window_files)."""
+    parquet, csv = [], []
+    for file_path in bronze_read_files():
+        (parquet if file_path.endswith(".parquet") else csv).append(file_path)
+    return parquet, csv
+
+
+def partition_year(file_path):
+    match = re.search(r"year=(\d{4})", file_path)
+    return int(match.group(1)) if match else None
+
+
+def iter_fire_batches(files, first_year=FIRST_YEAR, dedup_filter=None):
+    """
+    (acq_date, frp, dedup_key) batches of every detection from first_year on, one
+    bronze file at a time (Parquet partitions of earlier years are not opened).
+    With a DedupFilter, detections it has already seen are dropped. Files are read
+    in order of their earliest possible day, and the filter forgets only the days
+    no later file can hold, so a day's duplicates are always caught (exact counts).
+    """
+    first_day = pa.scalar(date(first_year, 1, 1), pa.date32())
+    for file_path in sorted(files, key=earliest_day):
+        year = partition_year(file_path)
+        if year is not None and year < first_year:
+            continue
+        if dedup_filter is not None:
+            dedup_filter.forget_before(earliest_day(file_path))
+        for batch in iter_bronze_batches(file_path, FIRE_COLUMNS, LOAD_COLUMN_TYPES):
+            batch = batch.filter(pc.greater_equal(batch.column("acq_date"), first_day))
+            if batch.num_rows:
+                yield with_dedup_keys(batch, ["acq_date", "frp"], dedup_filter)
+
+
+def summary_duckdb(parquet_files, csv_files, temp_file=TEMP_FILE, first_year=FIRST_YEAR):
+    """
+    Annual summary computed by DuckDB over the bronze files. Returns an Arrow table.
+    With FIRE_DEDUP on, each row's dedup_key is computed in SQL (fire_dedup.dedup_key_sql)
+    and every detection is counted exactly once.
+    """
+    import duckdb
+
+    first_day = date(first_year, 1, 1)
+    key = f", {dedup_key_sql()} AS dedup_key" if DEDUP_ENABLED else ""
+    sources, params = [], []
+    if parquet_files:
+        sources.append(PARQUET_SOURCE_SQL.format(key=key))
+        params += [parquet_files, first_year, first_day]
+    if csv_files:
+        sources.append(CSV_SOURCE_SQL.format(key=key))
+        params += [csv_files, first_day]
+
+    if not sources:
+        # No bronze yet: every year gets zero fires, exactly like the LEFT JOIN in Postgres
+        fire_sources = "SELECT NULL::DATE AS acq_date, NULL::FLOAT AS frp WHERE false"
+    else:
+        fire_sources = "\n    UNION ALL\n".join(sources)
+        if DEDUP_ENABLED:
+            fire_sources = DEDUP_SOURCE_SQL.format(sources=fire_sources)
+
+    sql = DUCKDB_SUMMARY_SQL.format(fire_sources=fire_sources)
+    with duckdb.connect() as conn:
+        conn.execute(f"SET threads = {max(1, DUCKDB_THREADS)}")
+        conn.execute(f"SET memory_limit = '{DUCKDB_MEMORY_LIMIT}'")
+        return conn.execute(sql, params + [temp_file, first_year]).fetch_arrow_table()
+
+
+def fold_years(batches, years):
+    """Adds (acq_date, frp) batches into per-year [count, frp count, frp sum, frp max]."""
+    for batch in batches:
+        count("rows_parsed", batch.num_rows)
+        if batch.num_rows == 0:
+            continue
+        table = pa.table({"year": pc.year(batch.column(0)), "frp": batch.column(1)})
+        grouped = table.group_by("year").aggregate([("year", "count"), ("frp", "count"),
+                                                    ("frp", "sum"), ("frp", "max")])
+        for row in grouped.to_pylist():
+            current = years.setdefault(row["year"], [0, 0, 0.0, None])
+            current[0] += row["year_count"]
+            current[1] += row["frp_count"]
+            current[2] += row["frp_sum"] or 0.0
+            if row["frp_max"] is not None and (current[3] is None or row["frp_max"] > current[3]):
+                current[3] = row["frp_max"]
+
+
+def summary_arrow(parquet_files, csv_files, temp_file=TEMP_FILE, first_year=FIRST_YEAR):
+    """
+    Same summary with Arrow compute only: a filtered, projected dataset scan per year.
+    With FIRE_DEDUP on, the rows go through a DedupFilter first (exact, see
+    iter_fire_batches; it holds the keys of about one month of detections).
+    """
+    first_day = date(first_year, 1, 1)
+    years = {}
+
+    if DEDUP_ENABLED:
+        fold_years(iter_fire_batches(parquet_files + csv_files, first_year, DedupFilter(memory_mb=None)), years)
+        parquet_files, csv_files = [], []
+
+    if parquet_files:
+        dataset = ds.dataset(parquet_files, format="parquet", partitioning="hive")
+        # The filter is pushed into the scan: whole files (year=) and row groups are skipped
+        row_filter = ds.field("acq_date") >= pa.scalar(first_day, pa.date32())
+        if "year" in dataset.schema.names:
+            row_filter &= ds.field("year") >= first_year
+        fold_years(dataset.to_batches(columns=["acq_date", "frp"], filter=row_filter), years)
+
+    for csv_file in csv_files:
+        batches = (b.filter(pc.greater_equal(b.column(0), pa.scalar(first_day, pa.date32())))
+                   for b in iter_bronze_batches(csv_file, ["acq_date", "frp"]))
+        fold_years(batches, years)
+
+    temps = pv.read_csv(temp_file, convert_options=pv.ConvertOptions(
+        column_types={"year": pa.int32(), "temp_anomaly_celsius": pa.float64()}))
+
+    rows = []
+    for year, anomaly in zip(temps["year"].to_pylist(), temps["temp_anomaly_celsius"].to_pylist()):
+        if year < first_year:
+            continue
+        total, frp_count, frp_sum, frp_max = years.get(year, [0, 0, 0.0, None])
+        rows.append({"year": year, "temp_anomaly_celsius": anomaly, "total_fires": total,
+                     "avg_intensity": frp_sum / frp_count if frp_count else 0.0,
+                     "max_intensity": frp_max if frp_max is not None else 0.0})
+
+    rows.sort(key=lambda row: -row["year"])
+    return pa.Table.from_pylist(rows, schema=pa.schema([
+        ("year", pa.int32()), ("temp_anomaly_celsius", pa.float64()), ("total_fires", pa.int64()),
+        ("avg_intensity", pa.float64()), ("max_intensity", pa.float64())]))
+
+
+def build_annual_summary(engine=GOLD_ENGINE, temp_file=TEMP_FILE, first_year=FIRST_YEAR):
+    """
+    Rebuilds the annual summary from bronze with a local engine ("duckdb" or "arrow").
+    Returns (Arrow table, engine actually used, number of bronze files scanned).
+    """
+    if engine == "duckdb":
+        try:
+            import duckdb  # noqa: F401
+        except ImportError:
+            print("[WARN] duckdb is not installed, using the Arrow engine instead.")
+            engine = "arrow"
+    if engine not in LOCAL_ENGINES:
+        raise ValueError(f"Unknown local gold engine '{engine}' (expected one of {LOCAL_ENGINES})")
+    if not os.path.exists(temp_file):
+        raise FileNotFoundError(f"{temp_file} not found. Run fetch_temperature.py first.")
+
+    parquet_files, csv_files = bronze_files_by_format()
+    summarize = summary_duckdb if engine == "duckdb" else summary_arrow
+
+    start = time.perf_counter()
+    with span(f"summary_{engine}", files=len(parquet_files) + len(csv_files)):
+        table = summarize(parquet_files, csv_files, temp_file, first_year)
+    print(f"{engine}: scanned {len(parquet_files)} Parquet + {len(csv_files)} CSV bronze files "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms.")
+    return table.select(SUMMARY_COLUMNS), engine, len(parquet_files) + len(csv_files)
+
+
+def write_summary_parquet(table, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path + ".part")
+    os.replace(path + ".part", path)
+    return path
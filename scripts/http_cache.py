@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+# Shared on-disk cache for every fetch script (FIRMS Area API, GISTEMP).
+#   <cache dir>/entries/<sha256 of redacted URL>.json   (validators + which body)
+#   <cache dir>/objects/<ab>/<sha256 of body>           (content-addressed bodies)
+# Identical bodies are stored once, whatever URL they came from.
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR") or \
+    os.path.join(os.getenv("PIPELINE_DATA_DIR", "/opt/airflow/data"), ".http_cache")
+
+# "on":      serve fresh entries, revalidate stale ones (ETag / Last-Modified)
+# "offline": replay from the cache only, never touch the network
+# "off":     bypass the cache entirely
+HTTP_CACHE_MODE = os.getenv("HTTP_CACHE_MODE", "on").lower()
+
+# Entries younger than this are served without asking the server at all
+HTTP_CACHE_TTL_SECONDS = float(os.getenv("HTTP_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+# Least recently used bodies are evicted once the cache grows past this size
+HTTP_CACHE_MAX_MB = float(os.getenv("HTTP_CACHE_MAX_MB", "2048"))
+
+REQUEST_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "120"))
+
+# Secrets that must never end up in a cache key or a log line
+SECRET_ENV_VARS = ("NASA_API_KEY",)
+SECRET_QUERY_PATTERN = re.compile(r"((?:api_?key|map_?key|token)=)[^&]+", re.IGNORECASE)
+
+
+class CacheMissError(Exception):
+    """Raised in offline mode when a URL has never been cached."""
+
+
+def redact_url(url, secrets=None):
+    """The URL with API keys replaced, so entries are shared across keys and safe to log."""
+    if secrets is None:
+        secrets = [os.getenv(name) for name in SECRET_ENV_VARS]
+    for secret in secrets:
+        if secret:
+            url = url.replace(secret, "REDACTED")
+    return SECRET_QUERY_PATTERN.sub(r"\1REDACTED", url)
+
+
+def response_body(response):
+    # Decompressed (gzip/deflate) body of a streamed requests response
+    response.raw.decode_content = True
+    return response.raw
+
+
+class HttpCache:
+    """
+    Content-addressed HTTP response cache.
+     - open(url) yields a binary file object over the body, from disk when possible.
+     - A stale entry is revalidated with If-None-Match / If-Modified-Since;
+       a 304 answer costs no body transfer.
+     - A new body is written to disk while the caller reads it, and only kept
+       if the caller read it to the end without raising.
+    """
+
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, mode=HTTP_CACHE_MODE, ttl=HTTP_CACHE_TTL_SECONDS,
+                 max_mb=HTTP_CACHE_MAX_MB, timeout=REQUEST_TIMEOUT, secrets=None):
+        if mode not in ("on", "offline", "off"):
+            raise ValueError(f"Unknown HTTP_CACHE_MODE '{mode}' (expected on, offline or off)")
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.timeout = timeout
+        self.secrets = secrets
+        self.lock = threading.Lock()
+        self.total_bytes = None  # computed lazily on the first store
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "evicted": 0}
+
+    def summary(self):
+        return ", ".join(f"{name} {count}" for name, count in self.stats.items())
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def key_for(self, url):
+        return hashlib.sha256(redact_url(url, self.secrets).encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, "entries", f"{key}.json")
+
+    def _object_path(self, digest):
+        return os.path.join(self.cache_dir, "objects", digest[:2], digest)
+
+    def lookup(self, url):
+        """The cache entry for url (only if its body is still on disk), else None."""
+        try:
+            with open(self._entry_path(self.key_for(url))) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if os.path.exists(self._object_path(entry["sha256"])) else None
+
+    def _default_get(self, url, headers):
+        response = requests.get(url, headers=headers, stream=True, timeout=self.timeout)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    @contextmanager
+    def open(self, url, get=None, ttl=None):
+        """
+        Yields a readable binary stream over the body of url.
+         - get(url, headers) must return a streamed requests response; it is only
+           called on a miss or to revalidate a stale entry.
+         - ttl overrides the default freshness lifetime for this call.
+        """
+        get = get or self._default_get
+        if self.mode == "off":
+            with get(url, {}) as response:
+                yield response_body(response)
+            return
+
+        key = self.key_for(url)
+        entry = self.lookup(url)
+        ttl = self.ttl if ttl is None else ttl
+
+        if entry and (self.mode == "offline" or time.time() - entry["stored_at"] < ttl):
+            self._count("hits")
+            with self._open_entry(key, entry) as body:
+                yield body
+            return
+
+        if self.mode == "offline":
+            raise CacheMissError(f"Not in the HTTP cache (offline mode): {redact_url(url, self.secrets)}")
+
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        with get(url, headers) as response:
+            if response.status_code == 304 and entry:
+                self._count("revalidated")
+                entry["stored_at"] = time.time()
+                self._write_entry(key, entry)
+                with self._open_entry(key, entry) as body:
+                    yield body
+                return
+
+            self._count("misses")
+            os.makedirs(os.path.join(self.cache_dir, "objects"), exist_ok=True)
+            tmp_path = os.path.join(self.cache_dir, "objects", f".{key}.{threading.get_ident()}.part")
+            tee = TeeStream(response_body(response), tmp_path)
+            try:
+                yield tee
+            except BaseException:
+                tee.close()
+                os.remove(tmp_path)
+                raise
+            tee.close()
+
+            if not tee.complete:
+                os.remove(tmp_path)
+                return
+
+            self._store(key, url, tee, tmp_path, response.headers)
+
+    @contextmanager
+    def _open_entry(self, key, entry):
+        # Touching the entry file records the access time used for LRU eviction
+        os.utime(self._entry_path(key))
+        with open(self._object_path(entry["sha256"]), "rb") as body:
+            yield body
+
+    def _write_entry(self, key, entry):
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def _store(self, key, url, tee, tmp_path, headers):
+        digest = tee.digest.hexdigest()
+        object_path = self._object_path(digest)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = self._disk_usage()
+
+            if os.path.exists(object_path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, object_path)
+                self.total_bytes += tee.bytes_read
+
+            self._write_entry(key, {
+                "url": redact_url(url, self.secrets),
+                "sha256": digest,
+                "size": tee.bytes_read,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "stored_at": time.time(),
+            })
+
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _disk_usage(self):
+        total = 0
+        for root, _, files in os.walk(os.path.join(self.cache_dir, "objects")):
+            total += sum(os.path.getsize(os.path.join(root, f)) for f in files if not f.startswith("."))
+        return total
+
+    def _evict(self):
+        """Drops least recently used entries until the cache is back under its budget."""
+        entries_dir = os.path.join(self.cache_dir, "entries")
+        entries = []
+        for name in os.listdir(entries_dir):
+            path = os.path.join(entries_dir, name)
+            try:
+                with open(path) as f:
+                    entries.append((os.path.getmtime(path), path, json.load(f)["sha256"]))
+            except (OSError, ValueError, KeyError):
+                continue
+
+        references = {}
+        for _, _, digest in entries:
+            references[digest] = references.get(digest, 0) + 1
+
+        for _, path, digest in sorted(entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            os.remove(path)
+            self.stats["evicted"] += 1
+            references[digest] -= 1
+            if references[digest] == 0 and os.path.exists(self._object_path(digest)):
+                self.total_bytes -= os.path.getsize(self._object_path(digest))
+                os.remove(self._object_path(digest))
+
+
+class TeeStream:
+    """
+    Read-only file object that copies everything read from `source` into a file
+    while hashing it. `complete` is set once the source has been read to the end.
+    """
+
+    def __init__(self, source, tmp_path):
+        self.source = source
+        self.file = open(tmp_path, "wb")
+        self.digest = hashlib.sha256()
+        self.bytes_read = 0
+        self.complete = False
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        data = self.source.read() if size is None or size < 0 else self.source.read(size)
+        data = data or b""
+        if data:
+            self.file.write(data)
+            self.digest.update(data)
+            self.bytes_read += len(data)
+        elif size != 0:
+            self.complete = True
+        return data
+
+    def close(self):
+        self.file.close()
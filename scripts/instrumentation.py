@@ -0,0 +1,286 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# --- CONFIGURATION ---
+# Lightweight metrics shared by every pipeline script:
+#  - span(name, ...) times a stage step or one file (count, total, max and peak memory)
+#  - count(name, n) adds to a counter (bytes_downloaded, rows_parsed, rows_loaded, ...)
+#  - run_stage(name) wraps a script's main: a background thread samples RSS, every
+#    span end is logged as a JSON line, and on exit (success or failure) the run is
+#    written as <stage>.json and a Prometheus <stage>.prom textfile. Exceptions are
+#    re-raised, so a failed script exits non-zero and its Airflow task fails.
+DATA_DIR = os.getenv("PIPELINE_DATA_DIR", "/opt/airflow/data")
+# Hidden folder: upload_to_s3 skips it. Point node_exporter's textfile collector here.
+METRICS_DIR = os.getenv("PIPELINE_METRICS_DIR") or os.path.join(DATA_DIR, ".metrics")
+
+# One JSON object per line on stderr (Airflow keeps it in the task log)
+JSON_LOGS = os.getenv("PIPELINE_JSON_LOGS", "true").lower() in ("1", "true", "yes")
+
+# RSS sampling interval; spans report the highest sample seen while they were open
+MEMORY_SAMPLE_SECONDS = float(os.getenv("PIPELINE_MEMORY_SAMPLE_SECONDS", "0.2"))
+
+METRIC_PREFIX = "pipeline"
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes():
+    """Current resident set size of this process (0 where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def peak_rss_bytes():
+    """
+    Peak RSS of this process so far. VmHWM starts fresh at exec, whereas ru_maxrss
+    also counts memory inherited from the parent at fork (KB on Linux, bytes on macOS).
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class OpenSpan:
+    """Peak RSS seen while one span is open (compared by identity, not value)."""
+    __slots__ = ("peak",)
+
+    def __init__(self, peak):
+        self.peak = peak
+
+
+class Metrics:
+    """Thread-safe spans and counters for one script run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.spans = {}
+        self.open_spans = []
+        self.peak_memory = 0
+
+    def reset(self):
+        with self.lock:
+            self.counters, self.spans, self.open_spans, self.peak_memory = {}, {}, [], 0
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds, peak_memory=0):
+        with self.lock:
+            span = self.spans.setdefault(name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                                "peak_memory_bytes": 0})
+            span["count"] += 1
+            span["seconds"] += seconds
+            span["max_seconds"] = max(span["max_seconds"], seconds)
+            span["peak_memory_bytes"] = max(span["peak_memory_bytes"], peak_memory)
+
+    def sample_memory(self):
+        rss = rss_bytes()
+        with self.lock:
+            self.peak_memory = max(self.peak_memory, rss)
+            for span in self.open_spans:
+                span.peak = max(span.peak, rss)
+
+    def open_span(self):
+        span = OpenSpan(rss_bytes())
+        with self.lock:
+            self.open_spans.append(span)
+        return span
+
+    def close_span(self, span):
+        with self.lock:
+            self.open_spans.remove(span)
+        return max(span.peak, rss_bytes())
+
+
+METRICS = Metrics()
+_current_stage = None
+
+
+def log_event(event, **fields):
+    if not JSON_LOGS:
+        return
+    record = {"ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+              "stage": _current_stage, "event": event, **fields}
+    # Set by Airflow for every task, ties the line to its DAG run
+    run_id = os.getenv("AIRFLOW_CTX_DAG_RUN_ID")
+    if run_id:
+        record["run_id"] = run_id
+    print(json.dumps(record, default=str), file=sys.stderr, flush=True)
+
+
+def count(name, value=1):
+    """Adds value to the counter `name` (thread-safe, cheap enough for per-batch calls)."""
+    METRICS.count(name, value)
+
+
+def observe(name, seconds, **labels):
+    """Records a span that was timed elsewhere (e.g. inside a worker process)."""
+    METRICS.observe(name, seconds)
+    log_event("span", span=name, seconds=round(seconds, 4), **labels)
+
+
+@contextmanager
+def span(name, **labels):
+    """
+    Times the block as one occurrence of `name`. Labels (file, window, ...) only go
+    to the JSON log; the Prometheus file aggregates per span name.
+    """
+    handle = METRICS.open_span()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "failed"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        peak = METRICS.close_span(handle)
+        METRICS.observe(name, seconds, peak)
+        log_event("span", span=name, seconds=round(seconds, 4), status=status,
+                  peak_memory_mb=round(peak / 1024 / 1024, 1), **labels)
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, interval=MEMORY_SAMPLE_SECONDS):
+        super().__init__(daemon=True, name="memory-sampler")
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            METRICS.sample_memory()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def prometheus_text(stage, summary):
+    """Prometheus text exposition format for one stage run."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        full_name = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{v}"' for k, v in {"stage": stage, **labels}.items())
+            lines.append(f"{full_name}{{{label_text}}} {value}")
+
+    metric("stage_duration_seconds", "gauge", "Wall time of the last run.", [({}, summary["seconds"])])
+    metric("stage_success", "gauge", "1 if the last run succeeded.", [({}, int(summary["status"] == "ok"))])
+    metric("stage_last_run_timestamp_seconds", "gauge", "When the last run finished.",
+           [({}, summary["finished_at"])])
+    metric("stage_peak_memory_bytes", "gauge", "Peak RSS of the last run.", [({}, summary["peak_memory_bytes"])])
+
+    spans = summary["spans"].items()
+    metric("span_seconds_total", "gauge", "Time spent in each span during the last run.",
+           [({"span": n}, s["seconds"]) for n, s in spans])
+    metric("span_count", "gauge", "Occurrences of each span during the last run.",
+           [({"span": n}, s["count"]) for n, s in spans])
+    metric("span_max_seconds", "gauge", "Slowest occurrence of each span.",
+           [({"span": n}, s["max_seconds"]) for n, s in spans])
+    metric("span_peak_memory_bytes", "gauge", "Peak RSS sampled while each span was open.",
+           [({"span": n}, s["peak_memory_bytes"]) for n, s in spans])
+
+    # Per-run values, so gauges: a "counter" would have to keep growing across runs
+    for name, value in sorted(summary["counters"].items()):
+        metric(name, "gauge", f"{name.replace('_', ' ').capitalize()} during the last run.", [({}, value)])
+    return "\n".join(lines) + "\n"
+
+
+def write_atomic(path, text):
+    # The textfile collector may read at any moment: never expose a half-written file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_stage_metrics(stage, summary, metrics_dir=None):
+    metrics_dir = metrics_dir or METRICS_DIR
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+        write_atomic(os.path.join(metrics_dir, f"{stage}.json"), json.dumps(summary, indent=1))
+        write_atomic(os.path.join(metrics_dir, f"{stage}.prom"), prometheus_text(stage, summary))
+    except OSError as e:
+        # Metrics must never be the reason a pipeline step fails
+        print(f"[WARN] Could not write metrics to {metrics_dir}: {e}", file=sys.stderr)
+
+
+def summarize(stage, seconds, status, error=None):
+    with METRICS.lock:
+        summary = {
+            "stage": stage,
+            "status": status,
+            "seconds": round(seconds, 3),
+            "finished_at": round(time.time(), 3),
+            "peak_memory_bytes": max([METRICS.peak_memory, peak_rss_bytes()]
+                                     + [s["peak_memory_bytes"] for s in METRICS.spans.values()]),
+            "counters": dict(METRICS.counters),
+            "spans": {name: {**s, "seconds": round(s["seconds"], 4), "max_seconds": round(s["max_seconds"], 4)}
+                      for name, s in METRICS.spans.items()},
+        }
+    if error is not None:
+        summary["error"] = f"{type(error).__name__}: {error}"
+    return summary
+
+
+@contextmanager
+def run_stage(stage):
+    """
+    Instruments a whole script run (a script's __main__ block, or a DAG task).
+    Yields a dict that holds the run summary once the block exits. The summary is
+    logged and written to METRICS_DIR even when the block raises; the exception then
+    propagates, so the process exits non-zero.
+    """
+    global _current_stage
+    _current_stage = stage
+    # Several stages can run in one process (Airflow tasks): start from zero
+    METRICS.reset()
+    sampler = MemorySampler()
+    sampler.start()
+    start = time.perf_counter()
+    log_event("stage_start")
+
+    result = {}
+    status, error = "ok", None
+    try:
+        yield result
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status, error = "failed", e
+        raise
+    except BaseException as e:
+        status, error = "failed", e
+        raise
+    finally:
+        sampler.stop()
+        METRICS.sample_memory()
+        summary = summarize(stage, time.perf_counter() - start, status, error)
+        result.update(summary)
+        log_event("stage_end", **{k: v for k, v in summary.items() if k != "stage"})
+        write_stage_metrics(stage, summary)
+
+        top = sorted(summary["spans"].items(), key=lambda item: -item[1]["seconds"])[:5]
+        breakdown = ", ".join(f"{name} {s['seconds']:.1f}s" for name, s in top)
+        print(f"[{stage}] {status} in {summary['seconds']:.1f}s, "
+              f"peak {summary['peak_memory_bytes'] / 1024 / 1024:.0f} MB"
+              + (f" ({breakdown})" if breakdown else ""))
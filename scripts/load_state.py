@@ -0,0 +1,162 @@
+import hashlib
+import os
+
+# --- CONFIGURATION ---
+# One row per source file that has been loaded into the warehouse.
+# A file is only reloaded when its size/mtime change AND its content hash differs.
+# row_count is the number of rows the file added to target_table (repeated
+# detections skipped by the load are not counted), whichever path loaded it.
+# source_keys (raw_fires only) are the source_key values its rows carry in raw_fires:
+# its own, plus those of the window files a compacted file replaced.
+LOAD_STATE_DDL = """
+CREATE TABLE IF NOT EXISTS load_state (
+    source_path   TEXT PRIMARY KEY,
+    target_table  TEXT NOT NULL,
+    size_bytes    BIGINT NOT NULL,
+    mtime         DOUBLE PRECISION NOT NULL,
+    content_hash  TEXT NOT NULL,
+    row_count     BIGINT NOT NULL,
+    min_date      DATE,
+    max_date      DATE,
+    source_keys   BIGINT[],
+    loaded_at     TIMESTAMP NOT NULL DEFAULT now()
+)
+"""
+
+# fire_date ranges touched by the loader since the gold layer was last refreshed.
+# A row with NULL bounds means "everything changed" (e.g. after a full reload).
+FIRE_DIRTY_RANGES_DDL = """
+CREATE TABLE IF NOT EXISTS fire_dirty_ranges (
+    min_date   DATE,
+    max_date   DATE,
+    marked_at  TIMESTAMP NOT NULL DEFAULT now()
+)
+"""
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(file_path):
+    """SHA-256 of a file, read in 1 MB chunks (constant memory)."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_key(source_path):
+    """Signed 64-bit key of a bronze file path (raw_fires.source_key of the rows it loaded)."""
+    digest = hashlib.blake2b(source_path.replace(os.sep, "/").encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def file_stat(file_path):
+    stat = os.stat(file_path)
+    return {"size_bytes": stat.st_size, "mtime": stat.st_mtime}
+
+
+def ensure_load_state(cursor):
+    cursor.execute(LOAD_STATE_DDL)
+    # Tables created before rows were attributed to their file (NULL = unknown)
+    cursor.execute("ALTER TABLE load_state ADD COLUMN IF NOT EXISTS source_keys BIGINT[]")
+    cursor.execute(FIRE_DIRTY_RANGES_DDL)
+
+
+def mark_fire_range_dirty(cursor, min_date=None, max_date=None):
+    """
+    Tells the gold layer that raw_fires changed between min_date and max_date.
+    Call it inside the same transaction as the change itself.
+    """
+    cursor.execute("INSERT INTO fire_dirty_ranges (min_date, max_date) VALUES (%s, %s)", (min_date, max_date))
+
+
+def fetch_load_state(cursor, target_table):
+    """Returns {source_path: state dict} for every file loaded into target_table."""
+    cursor.execute(
+        "SELECT source_path, size_bytes, mtime, content_hash, row_count, min_date, max_date, source_keys "
+        "FROM load_state WHERE target_table = %s",
+        (target_table,),
+    )
+    columns = ["source_path", "size_bytes", "mtime", "content_hash", "row_count", "min_date", "max_date",
+               "source_keys"]
+    return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+
+
+def upsert_load_state(cursor, source_path, target_table, size_bytes, mtime, content_hash,
+                      row_count, min_date=None, max_date=None, source_keys=None):
+    cursor.execute(
+        """
+        INSERT INTO load_state (source_path, target_table, size_bytes, mtime, content_hash,
+                                row_count, min_date, max_date, source_keys, loaded_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, now())
+        ON CONFLICT (source_path) DO UPDATE SET
+            target_table = EXCLUDED.target_table,
+            size_bytes = EXCLUDED.size_bytes,
+            mtime = EXCLUDED.mtime,
+            content_hash = EXCLUDED.content_hash,
+            row_count = EXCLUDED.row_count,
+            min_date = EXCLUDED.min_date,
+            max_date = EXCLUDED.max_date,
+            source_keys = EXCLUDED.source_keys,
+            loaded_at = now()
+        """,
+        (source_path, target_table, size_bytes, mtime, content_hash, row_count, min_date, max_date,
+         source_keys),
+    )
+
+
+def touch_load_state(cursor, source_path, mtime):
+    # Same content, new mtime (e.g. the file was copied): remember the new mtime
+    # so the next run can skip it without hashing again
+    cursor.execute("UPDATE load_state SET mtime = %s WHERE source_path = %s", (mtime, source_path))
+
+
+def add_load_state_rows(cursor, source_path, rows):
+    # Rows a file added after its own load (e.g. detections it shares with a file
+    # that was reloaded or removed since)
+    cursor.execute("UPDATE load_state SET row_count = row_count + %s WHERE source_path = %s", (rows, source_path))
+
+
+def delete_load_state(cursor, source_path=None, target_table=None):
+    if source_path is not None:
+        cursor.execute("DELETE FROM load_state WHERE source_path = %s", (source_path,))
+    elif target_table is not None:
+        cursor.execute("DELETE FROM load_state WHERE target_table = %s", (target_table,))
+
+
+def plan_changes(files, state):
+    """
+    Compares files on disk with the stored state.
+     - files: {source_path: absolute path}
+     - state: output of fetch_load_state()
+    Returns (new, changed, unchanged, touched, removed):
+     - new/changed: {source_path: fingerprint dict} to (re)load
+     - unchanged: list of source paths to skip
+     - touched: {source_path: mtime} same content but a new mtime
+     - removed: {source_path: state} loaded before but gone from disk
+    Files whose size and mtime match are skipped without being hashed.
+    """
+    new, changed, touched = {}, {}, {}
+    unchanged = []
+
+    for source_path, file_path in files.items():
+        fingerprint = file_stat(file_path)
+        previous = state.get(source_path)
+
+        if previous and previous["size_bytes"] == fingerprint["size_bytes"] \
+                and previous["mtime"] == fingerprint["mtime"]:
+            unchanged.append(source_path)
+            continue
+
+        fingerprint["content_hash"] = content_hash(file_path)
+        if previous is None:
+            new[source_path] = fingerprint
+        elif previous["content_hash"] == fingerprint["content_hash"]:
+            unchanged.append(source_path)
+            touched[source_path] = fingerprint["mtime"]
+        else:
+            changed[source_path] = fingerprint
+
+    removed = {path: s for path, s in state.items() if path not in files}
+    return new, changed, unchanged, touched, removed
@@ -0,0 +1,245 @@
+import io
+import os
+import tempfile
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+
+from bronze_reader import COMPACT_COLUMN_TYPES, iter_bronze_batches
+from fire_dedup import KEY_COLUMNS, DedupFilter, with_dedup_keys
+from load_state import source_key
+
+# --- CONFIGURATION ---
+# raw_fires keeps only what the analytics need, with explicit types
+# (source column in the FIRMS file -> column in raw_fires, Postgres type).
+# dedup_key has no source column: it is computed by fire_dedup.py.
+# source_key neither: it names the bronze file the row was loaded from
+# (load_state.source_key), so a changed or removed file takes exactly its own rows.
+RAW_FIRE_COLUMNS = [
+    ("latitude", "latitude", "DOUBLE PRECISION"),
+    ("longitude", "longitude", "DOUBLE PRECISION"),
+    ("acq_date", "fire_date", "DATE"),
+    ("frp", "intensity_mw", "REAL"),
+    ("confidence", "confidence", "TEXT"),
+    (None, "dedup_key", "BIGINT"),
+    (None, "source_key", "BIGINT"),
+]
+
+SOURCE_COLUMNS = [source for source, _, _ in RAW_FIRE_COLUMNS if source]
+TABLE_COLUMNS = [column for _, column, _ in RAW_FIRE_COLUMNS]
+# Read from bronze: the loaded columns plus what the dedup key is made of
+READ_COLUMNS = SOURCE_COLUMNS + [c for c in KEY_COLUMNS if c not in SOURCE_COLUMNS]
+
+# Rows already in raw_fires are skipped with this (matches its unique index)
+CONFLICT_TARGET = "(fire_date, dedup_key)"
+
+# raw_fires stores DOUBLE PRECISION coordinates, so the loader keeps them exact;
+# everything else uses the shared compact types
+LOAD_COLUMN_TYPES = {**COMPACT_COLUMN_TYPES, "latitude": pa.float64(), "longitude": pa.float64()}
+
+# Encoded files are spooled here between the parse process and the COPY thread
+SPOOL_DIR = os.getenv("FIRE_LOAD_SPOOL_DIR") or None
+
+
+class BatchCsvStream(io.RawIOBase):
+    """
+    File-like object that turns Arrow record batches into CSV text on demand.
+    psycopg2's copy_expert() pulls from it with read(), so a file is streamed
+    into COPY one batch at a time instead of being materialized.
+    If date_column is given, the min/max date seen is tracked on the way through.
+    """
+
+    def __init__(self, batches, date_column=None):
+        self.batches = iter(batches)
+        self.buffer = b""
+        self.rows = 0
+        self.date_column = date_column
+        self.min_date = None
+        self.max_date = None
+        self.write_options = pv.WriteOptions(include_header=False)
+
+    def readable(self):
+        return True
+
+    def _next_chunk(self):
+        for batch in self.batches:
+            if batch.num_rows == 0:
+                continue
+            self.rows += batch.num_rows
+            if self.date_column:
+                self._track_dates(batch.column(self.date_column))
+            sink = io.BytesIO()
+            pv.write_csv(pa.Table.from_batches([batch]), sink, write_options=self.write_options)
+            return sink.getvalue()
+        return b""
+
+    def _track_dates(self, dates):
+        bounds = pc.min_max(dates).as_py()
+        if bounds["min"] is None:
+            return
+        self.min_date = min(self.min_date or bounds["min"], bounds["min"])
+        self.max_date = max(self.max_date or bounds["max"], bounds["max"])
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = [self.buffer]
+            chunk = self._next_chunk()
+            while chunk:
+                chunks.append(chunk)
+                chunk = self._next_chunk()
+            self.buffer = b""
+            return b"".join(chunks)
+
+        while len(self.buffer) < size:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self.buffer += chunk
+
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def with_source_keys(batch, keys):
+    """A with_dedup_keys() batch plus its source_key column (one key per row, or one for all)."""
+    if not isinstance(keys, pa.Array):
+        keys = pa.array([keys] * batch.num_rows, pa.int64())
+    return pa.RecordBatch.from_arrays(list(batch.columns) + [keys], names=batch.schema.names + ["source_key"])
+
+
+def in_date_ranges(dates, date_ranges):
+    """Boolean mask of the dates inside any of the inclusive (low, high) ranges."""
+    mask = None
+    for low, high in date_ranges:
+        inside = pc.and_(pc.greater_equal(dates, pa.scalar(low, pa.date32())),
+                         pc.less_equal(dates, pa.scalar(high, pa.date32())))
+        mask = inside if mask is None else pc.or_(mask, inside)
+    return mask
+
+
+def iter_load_batches(file_path, dedup_filter=None, source_path=None, date_ranges=None):
+    """
+    One bronze file as raw_fires-ready batches (TABLE_COLUMNS order, dedup_key
+    and the source_key of source_path included). Rows the DedupFilter has already
+    seen, in this file or an earlier one, are dropped on the way.
+    date_ranges, if given, keeps only the rows inside those (low, high) ranges.
+    """
+    key = source_key(source_path) if source_path else None
+    for batch in iter_bronze_batches(file_path, READ_COLUMNS, LOAD_COLUMN_TYPES):
+        if date_ranges:
+            batch = batch.filter(in_date_ranges(batch.column("acq_date"), date_ranges))
+        yield with_source_keys(with_dedup_keys(batch, SOURCE_COLUMNS, dedup_filter), key)
+
+
+def copy_new_rows(cursor, table, copy, by_source=False):
+    """
+    Runs copy(target) into a temporary table, then moves its rows into `table`
+    with ON CONFLICT DO NOTHING: detections already in `table` (or repeated within
+    the copy) are skipped. Returns the number of rows inserted, or with
+    by_source=True {source_key: rows inserted}.
+    The temp table is dropped on success, so the next file of the same transaction
+    can create it again; after a failure the transaction is aborted and its
+    rollback drops it (ON COMMIT DROP covers a commit that skips the DROP).
+    """
+    cursor.execute(f"CREATE TEMP TABLE fire_load (LIKE {table}) ON COMMIT DROP")
+    copy("fire_load")
+    insert = (f"INSERT INTO {table} ({', '.join(TABLE_COLUMNS)}) "
+              f"SELECT {', '.join(TABLE_COLUMNS)} FROM fire_load "
+              f"ON CONFLICT {CONFLICT_TARGET} DO NOTHING")
+    if by_source:
+        cursor.execute(f"WITH inserted AS ({insert} RETURNING source_key) "
+                       "SELECT source_key, count(*) FROM inserted GROUP BY source_key")
+        inserted = dict(cursor.fetchall())
+    else:
+        cursor.execute(insert)
+        inserted = cursor.rowcount
+    cursor.execute("DROP TABLE fire_load")
+    return inserted
+
+
+def copy_batches(cursor, table, columns, batches):
+    """
+    COPYs Arrow batches into `table` and returns (rows, seconds).
+    """
+    stream = BatchCsvStream(batches)
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+
+    start = time.perf_counter()
+    cursor.copy_expert(sql, stream)
+    return stream.rows, time.perf_counter() - start
+
+
+def copy_csv_file(cursor, table, columns, csv_path, skip_existing=False):
+    """
+    COPYs an already-encoded CSV file (no header) into `table`.
+    skip_existing=True goes through copy_new_rows(). Returns (rows inserted or
+    None when not counted, seconds).
+    """
+    def copy(target):
+        with open(csv_path, "rb") as f:
+            cursor.copy_expert(f"COPY {target} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", f)
+
+    start = time.perf_counter()
+    if skip_existing:
+        inserted = copy_new_rows(cursor, table, copy)
+    else:
+        copy(table)
+        inserted = None
+    return inserted, time.perf_counter() - start
+
+
+def encode_fire_file(file_path, source_path=None):
+    """
+    Parses one bronze fire file into a COPY-ready CSV spool file, one batch at a
+    time (memory stays flat whatever the file size). Duplicates within the file
+    are dropped here already.
+    Module-level so it can run in a worker process; the caller deletes the spool.
+    Returns {"path", "rows", "duplicates", "min_date", "max_date", "seconds"}.
+    """
+    start = time.perf_counter()
+    dedup_filter = DedupFilter()
+    stream = BatchCsvStream(iter_load_batches(file_path, dedup_filter, source_path), date_column="acq_date")
+
+    with tempfile.NamedTemporaryFile("wb", suffix=".csv", dir=SPOOL_DIR, delete=False) as spool:
+        try:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+                spool.write(chunk)
+        except Exception:
+            spool.close()
+            os.remove(spool.name)
+            raise
+
+    return {"path": spool.name, "rows": stream.rows, "duplicates": dedup_filter.dropped,
+            "min_date": stream.min_date, "max_date": stream.max_date, "seconds": time.perf_counter() - start}
+
+
+def copy_fire_file(cursor, file_path, table="raw_fires", dedup_filter=None, skip_existing=False, source_path=None,
+                   date_ranges=None):
+    """
+    Streams one bronze fire file (Parquet or CSV) into `table` with COPY, its rows
+    tagged with the source_key of source_path (its path relative to bronze).
+     - dedup_filter (a DedupFilter, possibly shared across files) drops repeated
+       detections before they are sent; by default one filter per file.
+     - skip_existing=True also skips detections already in `table` (copy_new_rows).
+     - date_ranges limits the copy to the rows of those (low, high) date ranges.
+    Returns {"rows", "duplicates", "min_date", "max_date", "seconds"}.
+    """
+    dedup_filter = dedup_filter or DedupFilter()
+    dropped_before = dedup_filter.dropped
+    stream = BatchCsvStream(iter_load_batches(file_path, dedup_filter, source_path, date_ranges),
+                            date_column="acq_date")
+
+    def copy(target):
+        cursor.copy_expert(f"COPY {target} ({', '.join(TABLE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", stream)
+
+    start = time.perf_counter()
+    if skip_existing:
+        rows = copy_new_rows(cursor, table, copy)
+    else:
+        copy(table)
+        rows = stream.rows
+    duplicates = dedup_filter.dropped - dropped_before + (stream.rows - rows)
+    return {"rows": rows, "duplicates": duplicates, "min_date": stream.min_date,
+            "max_date": stream.max_date, "seconds": time.perf_counter() - start}
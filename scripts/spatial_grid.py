@@ -0,0 +1,300 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from bronze_reader import iter_bronze_batches
+from bronze_writer import COMPRESSION, COMPRESSION_LEVEL
+from fetch_fire_raw import bronze_read_files
+from instrumentation import count, run_stage, span
+
+# --- CONFIGURATION ---
+# Detections are binned into grid cells and summarized per (period, cell):
+#   fire_count, frp_count (detections with an FRP value), frp_sum, frp_max
+# "latlon": regular cells of GRID_RESOLUTION degrees (e.g. 0.25 or 1.0)
+# "hex":    pointy-top hexagons of GRID_RESOLUTION degrees (center to corner)
+#           on the lat/lon plane, an H3-like layout without the dependency
+GRID_KIND = os.getenv("FIRE_GRID_KIND", "latlon").lower()
+GRID_RESOLUTION = float(os.getenv("FIRE_GRID_RESOLUTION", "1.0"))
+GRID_PERIOD = os.getenv("FIRE_GRID_PERIOD", "month").lower()   # day, month or year
+
+# Chunks come from the shared bronze reader (sized by FIRE_READ_MEMORY_MB); this is
+# how many partial (period, cell) rows may pile up before they are merged.
+# Together they bound memory, whatever the input size.
+MERGE_ROWS = int(os.getenv("FIRE_GRID_MERGE_ROWS", str(4 * 1024 * 1024)))
+
+GOLD_DIR = os.path.join(os.getenv("PIPELINE_DATA_DIR", "/opt/airflow/data"), "gold")
+GRID_TABLE = "fire_grid_cells"
+GRID_COLUMNS = ["latitude", "longitude", "acq_date", "frp"]
+
+# period and cell id are packed into one int64 sort key
+CELL_BITS = 44
+HEX_OFFSET = 1 << 21
+SQRT3 = np.sqrt(3.0)
+
+FIRE_GRID_CELLS_DDL = f"""
+CREATE TABLE IF NOT EXISTS {GRID_TABLE} (
+    grid          TEXT NOT NULL,
+    period_start  DATE NOT NULL,
+    cell_id       BIGINT NOT NULL,
+    cell_lat      REAL NOT NULL,
+    cell_lon      REAL NOT NULL,
+    fire_count    BIGINT NOT NULL,
+    frp_count     BIGINT NOT NULL,
+    frp_sum       DOUBLE PRECISION NOT NULL,
+    frp_max       REAL,
+    PRIMARY KEY (grid, period_start, cell_id)
+)
+"""
+
+
+def grid_name(kind=GRID_KIND, resolution=GRID_RESOLUTION, period=GRID_PERIOD):
+    # e.g. "latlon_0.25_month", used as file name and as the gold table key
+    return f"{kind}_{resolution:g}_{period}"
+
+
+def latlon_cell_ids(lat, lon, resolution):
+    """
+    Row-major ids of regular lat/lon cells, computed on integer micro-degrees so
+    a point on a cell edge always lands in the same cell.
+    """
+    step = int(round(resolution * 1_000_000))
+    n_cols = -(-360_000_000 // step)
+    n_rows = -(-180_000_000 // step)
+    rows = (np.rint((lat.astype(np.float64) + 90.0) * 1_000_000).astype(np.int64)) // step
+    cols = (np.rint((lon.astype(np.float64) + 180.0) * 1_000_000).astype(np.int64)) // step
+    # The north pole / antimeridian edge belongs to the last row / column
+    rows = np.clip(rows, 0, n_rows - 1)
+    cols = np.clip(cols, 0, n_cols - 1)
+    return rows * n_cols + cols
+
+
+def latlon_cell_centers(cell_ids, resolution):
+    step = int(round(resolution * 1_000_000))
+    n_cols = -(-360_000_000 // step)
+    rows, cols = np.divmod(cell_ids, n_cols)
+    lat = np.minimum(-90.0 + (rows + 0.5) * resolution, 90.0)
+    lon = np.minimum(-180.0 + (cols + 0.5) * resolution, 180.0)
+    return lat, lon
+
+
+def hex_cell_ids(lat, lon, size):
+    """
+    Axial (q, r) coordinates of pointy-top hexagons, rounded through cube
+    coordinates, packed into one integer id.
+    """
+    x = lon.astype(np.float64)
+    y = lat.astype(np.float64)
+    q = (SQRT3 / 3.0 * x - y / 3.0) / size
+    r = (2.0 / 3.0 * y) / size
+    s = -q - r
+
+    rq, rr, rs = np.rint(q), np.rint(r), np.rint(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+
+    return (rq.astype(np.int64) + HEX_OFFSET) * (HEX_OFFSET * 2) + (rr.astype(np.int64) + HEX_OFFSET)
+
+
+def hex_cell_centers(cell_ids, size):
+    q, r = np.divmod(cell_ids, HEX_OFFSET * 2)
+    q, r = q - HEX_OFFSET, r - HEX_OFFSET
+    lon = size * SQRT3 * (q + r / 2.0)
+    lat = size * 1.5 * r
+    return lat, lon
+
+
+def cell_ids(lat, lon, kind=GRID_KIND, resolution=GRID_RESOLUTION):
+    if kind == "latlon":
+        return latlon_cell_ids(lat, lon, resolution)
+    if kind == "hex":
+        return hex_cell_ids(lat, lon, resolution)
+    raise ValueError(f"Unknown grid kind '{kind}' (expected latlon or hex)")
+
+
+def cell_centers(ids, kind=GRID_KIND, resolution=GRID_RESOLUTION):
+    if kind == "latlon":
+        return latlon_cell_centers(ids, resolution)
+    return hex_cell_centers(ids, resolution)
+
+
+def period_index(dates, period=GRID_PERIOD):
+    """Days, months or years since 1970 for a datetime64[D] array."""
+    units = {"day": "D", "month": "M", "year": "Y"}
+    if period not in units:
+        raise ValueError(f"Unknown grid period '{period}' (expected day, month or year)")
+    return dates.astype(f"datetime64[{units[period]}]").astype(np.int64)
+
+
+def period_starts(index, period=GRID_PERIOD):
+    units = {"day": "D", "month": "M", "year": "Y"}
+    return index.astype(f"datetime64[{units[period]}]").astype("datetime64[D]")
+
+
+def reduce_cells(keys, counts, frp_counts, frp_sums, frp_maxs):
+    """
+    Sort-and-segment reduction: one output row per distinct key, fully vectorized
+    (argsort + ufunc.reduceat instead of a Python loop or a dict).
+    """
+    if len(keys) == 0:
+        return keys, counts, frp_counts, frp_sums, frp_maxs
+
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return (keys[starts],
+            np.add.reduceat(counts[order], starts),
+            np.add.reduceat(frp_counts[order], starts),
+            np.add.reduceat(frp_sums[order], starts),
+            np.maximum.reduceat(frp_maxs[order], starts))
+
+
+class GridAccumulator:
+    """
+    Folds chunks of detections into per-(period, cell) partial aggregates.
+    Each chunk is reduced on arrival; the partials are merged whenever more than
+    merge_rows of them are buffered, so memory tracks the number of non-empty
+    cells, not the number of detections.
+    """
+
+    def __init__(self, kind=GRID_KIND, resolution=GRID_RESOLUTION, period=GRID_PERIOD, merge_rows=MERGE_ROWS):
+        self.kind = kind
+        self.resolution = resolution
+        self.period = period
+        self.merge_rows = merge_rows
+        self.parts = []
+        self.buffered = 0
+        self.rows_in = 0
+
+    def add(self, lat, lon, dates, frp):
+        """lat/lon: float arrays, dates: datetime64[D] array, frp: float array with NaN for missing."""
+        valid = ~(np.isnan(lat) | np.isnan(lon) | np.isnat(dates))
+        lat, lon, dates, frp = lat[valid], lon[valid], dates[valid], frp[valid]
+        self.rows_in += len(lat)
+
+        keys = (period_index(dates, self.period) << CELL_BITS) | cell_ids(lat, lon, self.kind, self.resolution)
+        has_frp = ~np.isnan(frp)
+        part = reduce_cells(keys,
+                            np.ones(len(keys), dtype=np.int64),
+                            has_frp.astype(np.int64),
+                            np.where(has_frp, frp, 0.0).astype(np.float64),
+                            np.where(has_frp, frp, -np.inf).astype(np.float32))
+        self.parts.append(part)
+        self.buffered += len(part[0])
+
+        if self.buffered > self.merge_rows:
+            self._merge()
+
+    def add_batch(self, batch):
+        # Arrow record batch with GRID_COLUMNS
+        self.add(batch.column("latitude").to_numpy(zero_copy_only=False),
+                 batch.column("longitude").to_numpy(zero_copy_only=False),
+                 batch.column("acq_date").to_numpy(zero_copy_only=False).astype("datetime64[D]"),
+                 batch.column("frp").to_numpy(zero_copy_only=False).astype(np.float32))
+
+    def _merge(self):
+        if len(self.parts) > 1:
+            merged = [np.concatenate(arrays) for arrays in zip(*self.parts)]
+            self.parts = [reduce_cells(*merged)]
+        self.buffered = len(self.parts[0][0]) if self.parts else 0
+
+    def to_table(self):
+        """The finished grid as an Arrow table sorted by (period_start, cell_id)."""
+        self._merge()
+        keys, counts, frp_counts, frp_sums, frp_maxs = self.parts[0] if self.parts else \
+            (np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64),
+             np.empty(0, np.float64), np.empty(0, np.float32))
+
+        ids = keys & ((1 << CELL_BITS) - 1)
+        lat, lon = cell_centers(ids, self.kind, self.resolution)
+        return pa.table({
+            "period_start": pa.array(period_starts(keys >> CELL_BITS, self.period), pa.date32()),
+            "cell_id": pa.array(ids, pa.int64()),
+            "cell_lat": pa.array(lat, pa.float32()),
+            "cell_lon": pa.array(lon, pa.float32()),
+            "fire_count": pa.array(counts, pa.int64()),
+            "frp_count": pa.array(frp_counts, pa.int64()),
+            "frp_sum": pa.array(frp_sums, pa.float64()),
+            # -inf marks cells where no detection had an FRP value
+            "frp_max": pa.array(np.where(np.isinf(frp_maxs), np.nan, frp_maxs), pa.float32(),
+                                from_pandas=True),
+        })
+
+
+def grid_bronze(kind=GRID_KIND, resolution=GRID_RESOLUTION, period=GRID_PERIOD):
+    """Grids every bronze fire file, one chunk at a time. Returns an Arrow table."""
+    accumulator = GridAccumulator(kind, resolution, period)
+    for file_path in bronze_read_files():
+        with span("grid_file", file=os.path.basename(file_path)):
+            for batch in iter_bronze_batches(file_path, GRID_COLUMNS):
+                count("rows_parsed", batch.num_rows)
+                accumulator.add_batch(batch)
+
+    print(f"Gridded {accumulator.rows_in:,} detections.")
+    return accumulator.to_table()
+
+
+def write_grid_parquet(table, name):
+    path = os.path.join(GOLD_DIR, f"fire_grid_{name}.parquet")
+    os.makedirs(GOLD_DIR, exist_ok=True)
+    pq.write_table(table, path + ".part", compression=COMPRESSION, compression_level=COMPRESSION_LEVEL)
+    os.replace(path + ".part", path)
+    return path
+
+
+def write_grid_table(engine, table, name):
+    """
+    Replaces one grid's rows in the fire_grid_cells gold table (single transaction,
+    COPY). Returns (rows, COPY seconds).
+    """
+    from pg_copy import copy_batches
+
+    with engine.begin() as conn:
+        cursor = conn.connection.cursor()
+        cursor.execute(FIRE_GRID_CELLS_DDL)
+        cursor.execute(f"DELETE FROM {GRID_TABLE} WHERE grid = %s", (name,))
+
+        grid_column = pa.array([name] * table.num_rows, pa.string())
+        rows, seconds = copy_batches(cursor, GRID_TABLE, ["grid"] + table.column_names,
+                                     table.add_column(0, "grid", grid_column).to_batches())
+    return rows, seconds
+
+
+def build_fire_grid(kind=GRID_KIND, resolution=GRID_RESOLUTION, period=GRID_PERIOD, to_postgres=False):
+    name = grid_name(kind, resolution, period)
+    print(f"--- Building fire grid '{name}' ---")
+
+    start = time.perf_counter()
+    table = grid_bronze(kind, resolution, period)
+    path = write_grid_parquet(table, name)
+    print(f"Saved {table.num_rows:,} (period, cell) rows to {path}")
+
+    if to_postgres:
+        from sqlalchemy import create_engine
+        from load_to_postgres import DB_CONN
+
+        with span("load_grid"):
+            rows, seconds = write_grid_table(create_engine(DB_CONN), table, name)
+        count("rows_loaded", rows)
+        rate = rows / seconds if seconds > 0 else 0
+        print(f"Loaded {rows:,} rows into {GRID_TABLE} ({rate:,.0f} rows/sec)")
+
+    print(f"SUCCESS: Grid built in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate fire detections into a spatial grid.")
+    parser.add_argument("--kind", choices=["latlon", "hex"], default=GRID_KIND)
+    parser.add_argument("--resolution", type=float, default=GRID_RESOLUTION, help="Cell size in degrees")
+    parser.add_argument("--period", choices=["day", "month", "year"], default=GRID_PERIOD)
+    parser.add_argument("--to-postgres", action="store_true", help=f"Also load the grid into {GRID_TABLE}")
+    args = parser.parse_args()
+
+    with run_stage("spatial_grid"):
+        build_fire_grid(args.kind, args.resolution, args.period, args.to_postgres)
@@ -0,0 +1,221 @@
+import argparse
+import io
+import os
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
+
+from date_windows import plan_windows, to_date, window_path
+
+# --- CONFIGURATION ---
+# Synthetic MODIS_SP detections with realistic shapes, for benchmarks and local runs:
+#  - Locations cluster in the big fire regions (weights roughly follow MODIS counts)
+#  - Brightness / FRP follow skewed distributions (FRP is log-normal, like the real product)
+#  - Every window is generated from a seed derived from its date, so the same
+#    request always returns the same bytes
+FIRMS_COLUMNS = ["latitude", "longitude", "brightness", "scan", "track", "acq_date", "acq_time",
+                 "satellite", "instrument", "confidence", "version", "bright_t31", "frp", "daynight", "type"]
+
+# (center lat, center lon, lat spread, lon spread, weight)
+FIRE_REGIONS = [
+    (-8.0, 22.0, 6.0, 10.0, 0.30),     # Southern Africa savanna
+    (9.0, 15.0, 3.0, 12.0, 0.18),      # Sahel
+    (-10.0, -55.0, 6.0, 8.0, 0.15),    # Amazon / Cerrado
+    (-18.0, 133.0, 6.0, 12.0, 0.10),   # Northern Australia
+    (17.0, 100.0, 5.0, 6.0, 0.10),     # Mainland Southeast Asia
+    (58.0, 110.0, 6.0, 25.0, 0.07),    # Siberia
+    (55.0, -115.0, 6.0, 15.0, 0.04),   # Canada
+    (38.0, -120.0, 4.0, 4.0, 0.02),    # California
+    (25.0, 80.0, 6.0, 8.0, 0.04),      # India
+]
+
+ROWS_PER_DAY = int(os.getenv("SYNTHETIC_ROWS_PER_DAY", "10000"))
+CHUNK_ROWS = 256 * 1024
+
+
+def window_seed(day):
+    return int(to_date(day).strftime("%Y%m%d"))
+
+
+def generate_day(day, rows, seed=None):
+    """One day of synthetic detections as an Arrow table (FIRMS column order)."""
+    day = to_date(day)
+    rng = np.random.default_rng(window_seed(day) if seed is None else seed)
+
+    regions = np.array([r[:4] for r in FIRE_REGIONS])
+    weights = np.array([r[4] for r in FIRE_REGIONS])
+    picks = rng.choice(len(FIRE_REGIONS), size=rows, p=weights / weights.sum())
+    lat = np.clip(rng.normal(regions[picks, 0], regions[picks, 2]), -89.9, 89.9).round(4)
+    lon = np.clip(rng.normal(regions[picks, 1], regions[picks, 3]), -179.9, 179.9).round(4)
+
+    brightness = (300 + rng.gamma(2.0, 12.0, rows)).round(1)
+    scan = (1 + rng.gamma(1.5, 0.4, rows)).round(1)
+    terra = rng.random(rows) < 0.5
+    daytime = rng.random(rows) < 0.7
+
+    return pa.table({
+        "latitude": lat,
+        "longitude": lon,
+        "brightness": brightness,
+        "scan": scan,
+        "track": (scan * rng.uniform(0.7, 1.0, rows)).round(1),
+        "acq_date": pa.array(np.full(rows, np.datetime64(day.isoformat(), "D")), pa.date32()),
+        "acq_time": rng.integers(0, 24, rows) * 100 + rng.integers(0, 60, rows),
+        "satellite": pa.array(np.where(terra, "Terra", "Aqua")),
+        "instrument": pa.array(np.full(rows, "MODIS")),
+        "confidence": rng.integers(0, 101, rows),
+        "version": pa.array(np.full(rows, "6.1")),
+        "bright_t31": (brightness - rng.gamma(2.0, 8.0, rows)).round(1),
+        "frp": rng.lognormal(2.5, 1.2, rows).round(1),
+        "daynight": pa.array(np.where(daytime, "D", "N")),
+        "type": rng.choice([0, 2, 3], size=rows, p=[0.95, 0.03, 0.02]),
+    })
+
+
+def iter_window_csv(window_start, days, rows_per_day=ROWS_PER_DAY):
+    """CSV bytes for one Area API window, yielded in chunks (header first)."""
+    yield (",".join(FIRMS_COLUMNS) + "\n").encode()
+    options = pv.WriteOptions(include_header=False)
+    for offset in range(days):
+        day = to_date(window_start) + timedelta(days=offset)
+        table = generate_day(day, rows_per_day)
+        for batch in table.to_batches(max_chunksize=CHUNK_ROWS):
+            sink = io.BytesIO()
+            pv.write_csv(pa.Table.from_batches([batch]), sink, write_options=options)
+            yield sink.getvalue()
+
+
+def write_bronze_csvs(base_dir, start_date, end_date, rows_per_day=ROWS_PER_DAY, days_per_file=10):
+    """
+    Writes synthetic raw CSV windows straight into the bronze layout
+    (<base>/<year>/fires_world_<date>_<N>d.csv), without going through HTTP.
+    Returns (files, bytes).
+    """
+    files, total_bytes = [], 0
+    for window_start, days in plan_windows(start_date, end_date, days_per_file):
+        path = window_path(base_dir, "world", window_start, days)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            for chunk in iter_window_csv(window_start, days, rows_per_day):
+                f.write(chunk)
+        files.append(path)
+        total_bytes += os.path.getsize(path)
+    return files, total_bytes
+
+
+def gistemp_csv(first_year=1880, last_year=2023, title="Land-Ocean: Global Means", seed=42):
+    """A GLB.Ts+dSST.csv look-alike (metadata line, header, one row per year)."""
+    rng = np.random.default_rng(seed)
+    months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+    lines = [title,
+             ",".join(["Year"] + months + ["J-D", "D-N", "DJF", "MAM", "JJA", "SON"])]
+    for year in range(first_year, last_year + 1):
+        trend = -0.3 + max(0, year - 1960) * 0.018
+        values = (trend + rng.normal(0, 0.1, 12)).round(2)
+        annual = round(float(values.mean()), 2)
+        seasons = [round(float(values[i:i + 3].mean()), 2) for i in (0, 2, 5, 8)]
+        lines.append(",".join([str(year)] + [f"{v:.2f}" for v in values] +
+                              [f"{annual:.2f}", f"{annual:.2f}"] + [f"{s:.2f}" for s in seasons]))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def gistemp_zonal_csv(first_year=1880, last_year=2023, seed=7):
+    """A ZonAnn.Ts+dSST.csv look-alike (header, annual means per latitude band)."""
+    rng = np.random.default_rng(seed)
+    bands = ["Glob", "NHem", "SHem", "24N-90N", "24S-24N", "90S-24S", "64N-90N", "44N-64N", "24N-44N",
+             "EQU-24N", "24S-EQU", "44S-24S", "64S-44S", "90S-64S"]
+    # Polar bands warm faster than the tropics
+    speed = np.array([1.0, 1.2, 0.8, 1.4, 0.9, 0.7, 2.5, 1.6, 1.1, 0.9, 0.9, 0.8, 0.6, 0.5])
+    lines = [",".join(["Year"] + bands)]
+    for year in range(first_year, last_year + 1):
+        trend = -0.3 + max(0, year - 1960) * 0.018
+        values = (trend * speed + rng.normal(0, 0.1, len(bands))).round(2)
+        lines.append(",".join([str(year)] + [f"{v:.2f}" for v in values]))
+    return ("\n".join(lines) + "\n").encode()
+
+
+GISTEMP_TABLES = {
+    "GLB.Ts+dSST.csv": lambda: gistemp_csv(),
+    "NH.Ts+dSST.csv": lambda: gistemp_csv(title="Land-Ocean: Northern Hemispheric Means", seed=43),
+    "SH.Ts+dSST.csv": lambda: gistemp_csv(title="Land-Ocean: Southern Hemispheric Means", seed=44),
+    "ZonAnn.Ts+dSST.csv": lambda: gistemp_zonal_csv(),
+}
+
+
+class StubFirmsServer:
+    """
+    Local stand-in for the FIRMS Area API and the GISTEMP download.
+     - /api/area/csv/<key>/<source>/<area>/<days>/<date> streams a synthetic window
+     - /gistemp/<table> returns a synthetic GISTEMP table (global, NH, SH, zonal)
+    Use as a context manager; base_url / gistemp_url point at it.
+    """
+
+    def __init__(self, rows_per_day=ROWS_PER_DAY, host="127.0.0.1", port=0):
+        rows = rows_per_day
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/gistemp/"):
+                    table = GISTEMP_TABLES.get(self.path.rsplit("/", 1)[-1])
+                    if table is None:
+                        self.send_error(404)
+                        return
+                    body = table()
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                parts = self.path.rstrip("/").split("/")
+                if len(parts) < 8 or parts[1:4] != ["api", "area", "csv"]:
+                    self.send_error(404)
+                    return
+
+                # Close-delimited body: generated and sent one chunk at a time
+                self.send_response(200)
+                self.send_header("Content-Type", "text/csv")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for chunk in iter_window_csv(parts[-1], int(parts[-2]), rows):
+                    self.wfile.write(chunk)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def gistemp_url(self):
+        return f"{self.base_url}/gistemp/GLB.Ts+dSST.csv"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic FIRMS CSVs into a bronze folder.")
+    parser.add_argument("output_dir", help="Bronze fires folder, e.g. data/bronze/fires")
+    parser.add_argument("--start", default="2023-01-01")
+    parser.add_argument("--end", default="2023-01-10")
+    parser.add_argument("--rows-per-day", type=int, default=ROWS_PER_DAY)
+    args = parser.parse_args()
+
+    files, total_bytes = write_bronze_csvs(args.output_dir, args.start, args.end, args.rows_per_day)
+    print(f"Wrote {len(files)} files ({total_bytes / 1024 / 1024:.1f} MB) to {args.output_dir}")
@@ -1,70 +1,204 @@
 import boto3
+import hashlib
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from dotenv import load_dotenv
-from botocore.exceptions import ClientError
+
+from instrumentation import count, run_stage, span
 
 load_dotenv()
 AWS_BUCKET = os.getenv("S3_BUCKET_NAME")
 AWS_REGION = os.getenv("AWS_DEFAULT_REGION", "us-east-1")
-DATA_DIR = "/opt/airflow/data"
+# Optional: point at MinIO / a local S3 stand-in
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+DATA_DIR = os.getenv("PIPELINE_DATA_DIR", "/opt/airflow/data")
+
+# --- SYNC TUNING ---
+# Files are uploaded by UPLOAD_WORKERS threads; each large file is additionally
+# split into MULTIPART_CHUNK_MB parts sent MULTIPART_CONCURRENCY at a time.
+UPLOAD_WORKERS = int(os.getenv("S3_UPLOAD_WORKERS", "8"))
+MULTIPART_THRESHOLD_MB = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "16"))
+MULTIPART_CHUNK_MB = int(os.getenv("S3_MULTIPART_CHUNK_MB", "16"))
+MULTIPART_CONCURRENCY = int(os.getenv("S3_MULTIPART_CONCURRENCY", "4"))
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD_MB * 1024 * 1024,
+    multipart_chunksize=MULTIPART_CHUNK_MB * 1024 * 1024,
+    max_concurrency=MULTIPART_CONCURRENCY,
+    use_threads=True,
+)
+
+# Remembers the ETag computed for each local file (by size + mtime) so
+# unchanged files are not re-hashed on every run
+SYNC_CACHE_FILE = ".s3_sync_cache.json"
+
+def build_s3_client():
+    # Enough pooled connections for every worker's multipart threads
+    config = Config(max_pool_connections=UPLOAD_WORKERS * MULTIPART_CONCURRENCY,
+                    retries={"max_attempts": 10, "mode": "adaptive"})
+    return boto3.client('s3', region_name=AWS_REGION, endpoint_url=S3_ENDPOINT_URL, config=config)
 
-def file_exists_in_s3(s3_client, bucket, key):
+def list_remote_objects(s3_client, bucket, prefix=""):
     """
-    Checks if a file exists in S3 without downloading it.
+    One paginated listing of the bucket (1000 keys per call) instead of one
+    head_object round trip per file. Returns {key: (size, etag)}.
     """
-    try:
-        # head_object retrieves ONLY metadata (fast & cheap)
-        s3_client.head_object(Bucket=bucket, Key=key)
-        return True
-    except ClientError as e:
-        # If the error code is 404 (Not Found), then the file is missing
-        if e.response['Error']['Code'] == "404":
-            return False
-        else:
-            # If it's another error (permission, etc.), crash nicely
-            print(f"Error checking {key}: {e}")
-            return False
-
-def upload_directory_to_s3():
-    if not AWS_BUCKET:
-        print("CRITICAL ERROR: S3_BUCKET_NAME not found.")
-        return
-
-    print(f"--- Starting Smart Upload to S3 ({AWS_BUCKET}) ---")
-    
-    s3 = boto3.client('s3', region_name=AWS_REGION)
-    files_uploaded = 0
-    files_skipped = 0
+    index = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            index[obj['Key']] = (obj['Size'], obj['ETag'].strip('"'))
+    return index
+
+def local_etag(file_path, size, config=None):
+    """
+    The ETag S3 will report for this file when uploaded with `config`:
+     - single PUT: MD5 of the content
+     - multipart: MD5 of the concatenated part MD5s, plus "-<number of parts>"
+    """
+    config = config or TRANSFER_CONFIG
+    chunk_size = config.multipart_chunksize
+    with open(file_path, 'rb') as f:
+        if size < config.multipart_threshold:
+            digest = hashlib.md5()
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+            return digest.hexdigest()
+
+        part_digests = []
+        for part in iter(lambda: f.read(chunk_size), b""):
+            part_digests.append(hashlib.md5(part).digest())
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+def load_sync_cache(data_dir):
+    path = os.path.join(data_dir, SYNC_CACHE_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
 
-    # Walk through all folders
-    for root, dirs, files in os.walk(DATA_DIR):
+def save_sync_cache(data_dir, cache):
+    path = os.path.join(data_dir, SYNC_CACHE_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(cache, f)
+    os.replace(path + ".tmp", path)
+
+def walk_local_files(data_dir):
+    """Yields (local_path, s3_key, size, mtime) for every file to sync."""
+    for root, dirs, files in os.walk(data_dir):
+        # Hidden folders (e.g. the local HTTP cache) are never synced
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
         for file in files:
-            # Skip hidden files
-            if file.startswith('.'):
+            # Skip hidden files and downloads that are still in progress
+            if file.startswith('.') or file.endswith('.part'):
                 continue
-                
+
             local_path = os.path.join(root, file)
-            
+            stat = os.stat(local_path)
+
             # Create the S3 Key (Relative Path)
-            # Example: data/bronze/fires/2000/file.csv -> raw/fires/2000/file.csv
-            relative_path = os.path.relpath(local_path, DATA_DIR)
+            # Example: data/bronze/fires/2000/file.csv -> bronze/fires/2000/file.csv
+            relative_path = os.path.relpath(local_path, data_dir)
             s3_key = relative_path.replace("\\", "/") # Windows fix
+            yield local_path, s3_key, stat.st_size, stat.st_mtime
+
+def plan_uploads(data_dir, remote_index, cache):
+    """
+    Decides which files must be sent. A file is uploaded when its key is missing,
+    its size differs, or its ETag (content MD5) differs from the bucket's.
+    """
+    to_upload, skipped = [], []
+
+    for local_path, s3_key, size, mtime in walk_local_files(data_dir):
+        remote = remote_index.get(s3_key)
+        if remote is None or remote[0] != size:
+            to_upload.append((local_path, s3_key, size))
+            continue
+
+        cached = cache.get(s3_key)
+        if cached and cached["size"] == size and cached["mtime"] == mtime:
+            etag = cached["etag"]
+        else:
+            etag = local_etag(local_path, size)
+            cache[s3_key] = {"size": size, "mtime": mtime, "etag": etag}
+
+        if etag == remote[1]:
+            skipped.append(s3_key)
+        else:
+            to_upload.append((local_path, s3_key, size))
+
+    return to_upload, skipped
+
+def upload_directory_to_s3(s3_client=None, bucket=AWS_BUCKET, data_dir=DATA_DIR, workers=UPLOAD_WORKERS):
+    if not bucket:
+        raise RuntimeError("S3_BUCKET_NAME not found.")
+
+    print(f"--- Starting Smart Sync to S3 ({bucket}) ---")
+    s3 = s3_client or build_s3_client()
+    start = time.perf_counter()
+
+    # 1. One bulk listing of the bucket into an in-memory index
+    with span("list_bucket"):
+        remote_index = list_remote_objects(s3, bucket)
+    print(f"Indexed {len(remote_index)} remote objects in {time.perf_counter() - start:.1f}s")
+
+    # 2. Compare local files against it (size, then ETag/MD5)
+    cache = load_sync_cache(data_dir)
+    with span("plan_uploads"):
+        to_upload, skipped = plan_uploads(data_dir, remote_index, cache)
+    print(f"{len(to_upload)} files to upload, {len(skipped)} unchanged.")
+
+    # 3. Upload through a thread pool; large files go multipart
+    files_uploaded = 0
+    bytes_uploaded = 0
+    failures = 0
+    upload_start = time.perf_counter()
+
+    def upload_one(local_path, s3_key):
+        with span("upload", key=s3_key):
+            s3.upload_file(local_path, bucket, s3_key, Config=TRANSFER_CONFIG)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(upload_one, local_path, s3_key): (local_path, s3_key, size)
+                   for local_path, s3_key, size in to_upload}
+        for future in as_completed(futures):
+            local_path, s3_key, size = futures[future]
+            try:
+                future.result()
+                print(f" [UPLOAD] {s3_key}")
+                files_uploaded += 1
+                bytes_uploaded += size
+                count("objects_uploaded")
+                count("bytes_uploaded", size)
+                # Next run can compare against the ETag we just produced
+                stat = os.stat(local_path)
+                cache[s3_key] = {"size": stat.st_size, "mtime": stat.st_mtime,
+                                 "etag": local_etag(local_path, stat.st_size)}
+            except Exception as e:
+                failures += 1
+                print(f" [ERROR] Failed to upload {s3_key}: {e}")
+
+    save_sync_cache(data_dir, cache)
+
+    upload_seconds = time.perf_counter() - upload_start
+    throughput = bytes_uploaded / 1024 / 1024 / upload_seconds if upload_seconds > 0 else 0
+
+    print("\n--- Job Complete ---")
+    print(f"Uploaded: {files_uploaded} ({bytes_uploaded / 1024 / 1024:.1f} MB, {throughput:.1f} MB/s)")
+    print(f"Skipped:  {len(skipped)}")
+    print(f"Failed:   {failures}")
+    print(f"Total time: {time.perf_counter() - start:.1f}s")
+
+    # The sync cache is saved first, so a retry only re-sends the failed files
+    if failures:
+        raise RuntimeError(f"{failures} of {len(to_upload)} uploads failed.")
 
-            # --- THE SMART CHECK ---
-            if file_exists_in_s3(s3, AWS_BUCKET, s3_key):
-                print(f" [SKIP] {s3_key} already exists.")
-                files_skipped += 1
-            else:
-                try:
-                    s3.upload_file(local_path, AWS_BUCKET, s3_key)
-                    print(f" [UPLOAD] {s3_key}")
-                    files_uploaded += 1
-                except Exception as e:
-                    print(f" [ERROR] Failed to upload {file}: {e}")
-
-    print(f"\n--- Job Complete ---")
-    print(f"Uploaded: {files_uploaded}")
-    print(f"Skipped:  {files_skipped}")
+    return {"uploaded": files_uploaded, "skipped": len(skipped), "failed": failures, "bytes": bytes_uploaded}
 
 if __name__ == "__main__":
-    upload_directory_to_s3()
\ No newline at end of file
+    with run_stage("upload_to_s3"):
+        upload_directory_to_s3()
@@ -1,49 +1,229 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import csv
+import hashlib
+import json
 import os
+from datetime import date
+
+from instrumentation import count, run_stage, span
 
 # Configuration
-INPUT_FILE = "/opt/airflow/data/gold/final_climate_fire_analysis.csv"
-OUTPUT_IMG = "/opt/airflow/data/gold/climate_fire_correlation.png"
-
-def plot_trends():
-    print("--- Generating Correlation Chart ---")
-    
-    # 1. Read the Gold Data
-    if not os.path.exists(INPUT_FILE):
-        print("ERROR: Gold data file not found. Run transform_data.py first.")
-        return
-        
-    df = pd.read_csv(INPUT_FILE).sort_values("year")
-    
-    # 2. Setup the Plot (Dual Axis)
-    fig, ax1 = plt.subplots(figsize=(12, 6))
-    
-    # Plot Temperature (Red Line)
+DATA_DIR = os.getenv("PIPELINE_DATA_DIR", "/opt/airflow/data")
+GOLD_DIR = os.path.join(DATA_DIR, "gold")
+INPUT_FILE = os.path.join(GOLD_DIR, "final_climate_fire_analysis.csv")
+OUTPUT_IMG = os.path.join(GOLD_DIR, "climate_fire_correlation.png")
+
+# Charts drawn in one run, all from data loaded once:
+#  - global:  temperature anomaly vs. yearly fire count (the gold summary)
+#  - zones:   yearly fires per latitude zone    (fire rollups in Postgres)
+#  - monthly: monthly global fire count         (fire rollups in Postgres)
+CHARTS = [c.strip() for c in os.getenv("CHART_NAMES", "global,zones,monthly").split(",") if c.strip()]
+CHART_FILES = {
+    "global": OUTPUT_IMG,
+    "zones": os.path.join(GOLD_DIR, "fires_by_zone.png"),
+    "monthly": os.path.join(GOLD_DIR, "fires_monthly.png"),
+}
+CHART_DPI = int(os.getenv("CHART_DPI", "100"))
+
+# Input hash of every chart drawn last time: a chart whose data (and drawing code
+# version) did not change is not redrawn. Bump RENDER_VERSION when the drawing changes.
+CACHE_FILE = os.path.join(GOLD_DIR, ".chart_cache.json")
+RENDER_VERSION = 1
+
+
+def read_gold_rows(path=INPUT_FILE):
+    """The gold CSV as a list of dicts with numbers (csv module: no pandas import)."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Gold data file {path} not found. Run transform_data.py first.")
+    with open(path, newline="") as f:
+        return [{"year": int(row["year"]),
+                 "temp_anomaly_celsius": float(row["temp_anomaly_celsius"]),
+                 "total_fires": int(float(row["total_fires"])),
+                 "avg_intensity": float(row["avg_intensity"]),
+                 "max_intensity": float(row["max_intensity"])}
+                for row in csv.DictReader(f)]
+
+
+def load_rollup_data(years, charts):
+    """
+    Zone and monthly series from the fire rollups, for the years that have fires.
+    Without Postgres (e.g. GOLD_ENGINE=duckdb) those charts are skipped, not failed.
+    """
+    wanted = [name for name in ("zones", "monthly") if name in charts]
+    if not wanted or not years:
+        return {}
+    try:
+        from rollups import fire_rollup_rows
+
+        start, end = date(min(years), 1, 1), date(max(years), 12, 31)
+        data = {}
+        if "zones" in wanted:
+            data["zones"] = fire_rollup_rows(start, end, "year", by_zone=True)[0]
+        if "monthly" in wanted:
+            data["monthly"] = fire_rollup_rows(start, end, "month")[0]
+        return data
+    except Exception as e:
+        print(f"[WARN] Fire rollups unavailable, skipping {wanted}: {e}")
+        return {}
+
+
+def input_hash(name, data):
+    payload = json.dumps({"version": RENDER_VERSION, "chart": name, "dpi": CHART_DPI, "data": data},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def read_cache():
+    try:
+        with open(CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_cache(cache):
+    tmp_path = f"{CACHE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp_path, CACHE_FILE)
+
+
+def new_figure(width=12, height=6):
+    """A figure on the Agg canvas directly: no pyplot, no GUI backend, no global state."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(width, height))
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def draw_global(rows, path):
+    import numpy as np
+
+    rows = sorted(rows, key=lambda row: row["year"])
+    years = np.array([row["year"] for row in rows])
+    anomaly = np.array([row["temp_anomaly_celsius"] for row in rows])
+    fires = np.array([row["total_fires"] for row in rows]) / 1_000_000
+
+    fig = new_figure()
+    ax1 = fig.subplots()
+
+    # Fires (orange bars) on a second y-axis, drawn behind the temperature line
+    ax2 = ax1.twinx()
+    color = 'tab:orange'
+    ax2.bar(years, fires, width=0.8, color=color, alpha=0.3, label='Fire Count')
+    ax2.set_ylabel('Total Global Fires (Millions)', color=color, fontsize=12)
+    ax2.tick_params(axis='y', labelcolor=color)
+
+    # Temperature (red line)
     color = 'tab:red'
+    ax1.set_zorder(ax2.get_zorder() + 1)
+    ax1.patch.set_visible(False)
+    ax1.plot(years, anomaly, color=color, marker='o', label='Temperature')
     ax1.set_xlabel('Year', fontsize=12)
     ax1.set_ylabel('Global Temp Anomaly (°C)', color=color, fontsize=12)
-    sns.lineplot(data=df, x='year', y='temp_anomaly_celsius', ax=ax1, color=color, marker='o', label='Temperature')
     ax1.tick_params(axis='y', labelcolor=color)
     ax1.grid(True, alpha=0.3)
 
-    # Create a second y-axis for Fires
-    ax2 = ax1.twinx()
-    color = 'tab:orange'
-    ax2.set_ylabel('Total Global Fires (Millions)', color=color, fontsize=12)
-    # We divide by 1,000,000 to make the axis cleaner
-    sns.barplot(data=df, x='year', y='total_fires', ax=ax2, color=color, alpha=0.3, label='Fire Count')
-    ax2.tick_params(axis='y', labelcolor=color)
+    if len(years):
+        ax1.set_title(f'Global Warming vs. Wildfire Frequency ({years.min()}-{years.max()})', fontsize=16, pad=20)
+    fig.tight_layout()
+    fig.savefig(path, dpi=CHART_DPI)
+
+
+def draw_zones(rows, path):
+    import numpy as np
+    from matplotlib.ticker import MaxNLocator
+    from rollups import ZONES
+
+    fig = new_figure()
+    ax = fig.subplots()
+    # North to south, like the legend of the GISTEMP zonal means
+    order = {name: i for i, (name, _) in enumerate(ZONES)}
+    zones = sorted({row["zone"] for row in rows}, key=lambda zone: order.get(zone, len(order)))
+    for zone in zones:
+        series = [row for row in rows if row["zone"] == zone]
+        years = np.array([row["period_start"].year for row in series])
+        fires = np.array([row["fire_count"] for row in series]) / 1_000
+        ax.plot(years, fires, marker='o', label=zone)
+    ax.set_xlabel('Year', fontsize=12)
+    ax.set_ylabel('Fires (Thousands)', fontsize=12)
+    ax.set_title('Wildfire Frequency by Latitude Zone', fontsize=16, pad=20)
+    ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+    ax.grid(True, alpha=0.3)
+    if zones:
+        ax.legend(loc='upper left', ncol=2, fontsize=9)
+    fig.tight_layout()
+    fig.savefig(path, dpi=CHART_DPI)
 
-    # Title & Layout
-    plt.title('Global Warming vs. Wildfire Frequency (2000-2023)', fontsize=16, pad=20)
+
+def draw_monthly(rows, path):
+    import numpy as np
+
+    months = np.array([row["period_start"] for row in rows], dtype="datetime64[D]")
+    fires = np.array([row["fire_count"] for row in rows]) / 1_000
+
+    fig = new_figure(14, 5)
+    ax = fig.subplots()
+    ax.plot(months, fires, color='tab:orange', linewidth=1.2)
+    ax.fill_between(months, fires, color='tab:orange', alpha=0.2)
+    ax.set_xlabel('Month', fontsize=12)
+    ax.set_ylabel('Fires (Thousands)', fontsize=12)
+    ax.set_title('Monthly Global Wildfire Frequency', fontsize=16, pad=20)
+    ax.grid(True, alpha=0.3)
     fig.tight_layout()
-    
-    # 3. Save
-    plt.savefig(OUTPUT_IMG)
-    print(f"SUCCESS: Chart saved to {OUTPUT_IMG}")
-    print("Go check your 'data/gold' folder on your laptop!")
+    fig.savefig(path, dpi=CHART_DPI)
+
+
+DRAWERS = {"global": draw_global, "zones": draw_zones, "monthly": draw_monthly}
+
+
+def render_charts(rows=None, charts=None):
+    """
+    Draws every chart in `charts` (default CHART_NAMES) and returns {name: path}.
+    rows (the annual summary records, e.g. from the transform task's XCom) skips
+    reading the gold CSV back from disk. A chart whose input hash matches the last
+    run and whose file still exists is not redrawn (matplotlib is not even imported).
+    """
+    charts = charts or CHARTS
+    unknown = [name for name in charts if name not in DRAWERS]
+    if unknown:
+        raise ValueError(f"Unknown charts {unknown} (expected some of {list(DRAWERS)})")
+
+    print("--- Generating Charts ---")
+    with span("load_chart_data"):
+        if rows is None:
+            rows = read_gold_rows()
+        data = {"global": rows}
+        data.update(load_rollup_data([row["year"] for row in rows if row["total_fires"]], charts))
+
+    os.makedirs(GOLD_DIR, exist_ok=True)
+    cache = read_cache()
+    paths = {}
+    for name in charts:
+        if name not in data:
+            continue
+        path = CHART_FILES[name]
+        digest = input_hash(name, data[name])
+        paths[name] = path
+        if cache.get(name) == digest and os.path.exists(path):
+            print(f"Unchanged: {path}")
+            count("charts_skipped")
+            continue
+
+        with span("render", chart=name):
+            DRAWERS[name](data[name], path)
+        cache[name] = digest
+        count("charts_rendered")
+        print(f"SUCCESS: Chart saved to {path}")
+
+    write_cache(cache)
+    return paths
+
+def plot_trends(rows=None):
+    """The temperature vs. fire chart (plus the other CHART_NAMES); returns its path."""
+    return render_charts(rows).get("global", OUTPUT_IMG)
 
 if __name__ == "__main__":
-    plot_trends()
\ No newline at end of file
+    with run_stage("visualize_trends"):
+        render_charts()
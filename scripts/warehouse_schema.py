@@ -0,0 +1,230 @@
+import os
+import re
+
+from date_windows import parse_window_path
+from pg_copy import RAW_FIRE_COLUMNS
+
+# --- CONFIGURATION ---
+# raw_fires is declaratively partitioned by year on fire_date:
+#   raw_fires            (parent, PARTITION BY RANGE (fire_date))
+#   raw_fires_y2023      (one partition per year, created on demand)
+#   raw_fires_default    (safety net for dates without a year partition)
+# Indexes are declared on the parent and cascade to every partition:
+#   BRIN on fire_date (tiny, ideal for append-mostly time series)
+#   B-tree on (latitude, longitude) for region filters
+#   UNIQUE on (fire_date, dedup_key): one row per detection (see fire_dedup.py).
+#   A unique index on a partitioned table must include the partition key, hence fire_date.
+INDEX_DEFINITIONS = [
+    ("fire_date_brin", "USING brin (fire_date)", False),
+    ("lat_lon_idx", "(latitude, longitude)", False),
+    ("dedup_key", "(fire_date, dedup_key)", True),
+]
+
+YEAR_DIR_PATTERN = re.compile(r"^(?:year=)?(\d{4})$")
+
+# Every GISTEMP series in long format (fetch_temperature.SERIES_FILE): the global
+# and hemispheric monthly tables and the zonal annual means. raw_temperatures
+# keeps the global annual series the summary SQL joins on.
+CLIMATE_SERIES_DDL = """
+CREATE TABLE IF NOT EXISTS raw_temperatures_monthly (
+    dataset          TEXT NOT NULL,
+    series           TEXT NOT NULL,
+    year             INTEGER NOT NULL,
+    month            SMALLINT NOT NULL,  -- 1-12, 0 = annual mean
+    anomaly_celsius  DOUBLE PRECISION NOT NULL,
+    updated_at       TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (series, year, month)
+)
+"""
+
+
+def relation_kind(cursor, table):
+    """'p' = partitioned, 'r' = plain table, None = missing."""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def partition_name(table, year):
+    return f"{table}_y{year}"
+
+
+def ensure_climate_series_schema(cursor):
+    cursor.execute(CLIMATE_SERIES_DDL)
+
+
+def ensure_raw_fires_schema(cursor, table="raw_fires", years=(), unlogged=False, with_indexes=True):
+    """
+    Idempotently creates (or migrates to) the partitioned raw_fires layout.
+    Safe to call on every run: existing objects are left untouched.
+    """
+    if table == "raw_fires" and relation_kind(cursor, table) == "r":
+        migrate_legacy_raw_fires(cursor)
+
+    columns = ",\n    ".join(
+        f"{column} {sql_type}" + (" NOT NULL" if column == "fire_date" else "")
+        for _, column, sql_type in RAW_FIRE_COLUMNS
+    )
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} (\n    {columns}\n) PARTITION BY RANGE (fire_date)")
+    # Tables created before dedup_key existed (older rows keep a NULL key)
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS dedup_key BIGINT")
+    # ... and before rows carried the bronze file they came from (NULL until reloaded)
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS source_key BIGINT")
+
+    kind = "UNLOGGED TABLE" if unlogged else "TABLE"
+    cursor.execute(f"CREATE {kind} IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+
+    ensure_year_partitions(cursor, years, table, unlogged)
+
+    if with_indexes:
+        create_raw_fires_indexes(cursor, table)
+
+
+def create_raw_fires_indexes(cursor, table="raw_fires"):
+    """Creates the missing indexes. Returns the duplicate rows removed to build the unique one."""
+    removed = 0
+    for suffix, definition, unique in INDEX_DEFINITIONS:
+        name = f"{table}_{suffix}"
+        if unique and not relation_kind(cursor, name):
+            # e.g. a staging table filled by plain COPY: drop the repeats first
+            removed += remove_duplicate_fires(cursor, table)
+            if removed:
+                print(f"Removed {removed} duplicate detections from {table}.")
+        cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} {definition}")
+    return removed
+
+
+def remove_duplicate_fires(cursor, table="raw_fires"):
+    """
+    Keeps one row per (fire_date, dedup_key). Partitions are processed one at a
+    time, so each sort only spans one year. Returns the number of rows deleted.
+    """
+    cursor.execute("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(%s)", (table,))
+    partitions = [row[0] for row in cursor.fetchall()] or [table]
+
+    removed = 0
+    for partition in partitions:
+        cursor.execute(f"""
+            DELETE FROM {partition} fires
+            USING (
+                SELECT ctid FROM (
+                    SELECT ctid, row_number() OVER (PARTITION BY fire_date, dedup_key ORDER BY ctid) AS copy_number
+                    FROM {partition}
+                    WHERE dedup_key IS NOT NULL
+                ) ranked
+                WHERE copy_number > 1
+            ) duplicates
+            WHERE fires.ctid = duplicates.ctid
+        """)
+        removed += cursor.rowcount
+    return removed
+
+
+def ensure_year_partitions(cursor, years, table="raw_fires", unlogged=False):
+    """
+    Creates the yearly partitions that do not exist yet.
+    Rows that already landed in the default partition for that year are moved
+    into the new partition (Postgres refuses to create it otherwise).
+    """
+    kind = "UNLOGGED TABLE" if unlogged else "TABLE"
+
+    for year in sorted(set(years)):
+        name = partition_name(table, year)
+        if relation_kind(cursor, name):
+            continue
+
+        low, high = f"{year}-01-01", f"{year + 1}-01-01"
+        condition = "fire_date >= %s AND fire_date < %s"
+        cursor.execute(f"CREATE TEMP TABLE moved_fires AS SELECT * FROM {table}_default WHERE {condition}",
+                       (low, high))
+        cursor.execute(f"DELETE FROM {table}_default WHERE {condition}", (low, high))
+        cursor.execute(f"CREATE {kind} {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", (low, high))
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM moved_fires")
+        cursor.execute("DROP TABLE moved_fires")
+
+
+def migrate_legacy_raw_fires(cursor):
+    """
+    Converts a plain raw_fires table (pandas-created TEXT dates, or the first COPY
+    loader's unpartitioned table) into the partitioned layout, keeping its rows.
+    """
+    print("Migrating raw_fires to the partitioned schema...")
+    cursor.execute("ALTER TABLE raw_fires RENAME TO raw_fires_legacy")
+
+    cursor.execute("SELECT DISTINCT EXTRACT(YEAR FROM fire_date::date)::int FROM raw_fires_legacy "
+                   "WHERE fire_date IS NOT NULL")
+    years = [row[0] for row in cursor.fetchall()]
+    ensure_raw_fires_schema(cursor, "raw_fires", years, with_indexes=False)
+
+    cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'raw_fires_legacy'")
+    legacy_columns = {row[0] for row in cursor.fetchall()}
+
+    selects = []
+    for _, column, sql_type in RAW_FIRE_COLUMNS:
+        selects.append(f"{column}::{sql_type}" if column in legacy_columns else f"NULL::{sql_type}")
+
+    cursor.execute(f"INSERT INTO raw_fires ({', '.join(c for _, c, _ in RAW_FIRE_COLUMNS)}) "
+                   f"SELECT {', '.join(selects)} FROM raw_fires_legacy WHERE fire_date IS NOT NULL")
+    cursor.execute("DROP TABLE raw_fires_legacy")
+
+
+def set_partitions_logged(cursor, table):
+    # Partitioned parents have no storage of their own, so each partition is switched
+    cursor.execute("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(%s)", (table,))
+    for (partition,) in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE {partition} SET LOGGED")
+
+
+def prepare_staging(cursor, years, staging="raw_fires_staging"):
+    """
+    Fresh staging copy of raw_fires: same partitions, UNLOGGED (no WAL while
+    loading) and without indexes (built once at the end instead of per row).
+    """
+    cursor.execute(f"DROP TABLE IF EXISTS {staging} CASCADE")
+    ensure_raw_fires_schema(cursor, staging, years, unlogged=True, with_indexes=False)
+
+
+def promote_staging(cursor, staging="raw_fires_staging", live="raw_fires"):
+    # Index, make durable, then swap in (all inside the caller's transaction).
+    # Returns the duplicate rows dropped while indexing.
+    removed = create_raw_fires_indexes(cursor, staging)
+    set_partitions_logged(cursor, staging)
+    swap_tables(cursor, staging, live)
+    return removed
+
+
+def swap_tables(cursor, staging, live="raw_fires"):
+    """
+    Replaces `live` with `staging`: drops the live table (and its partitions), then
+    renames the staging parent, partitions and indexes to the live names.
+    Run inside a transaction so readers switch over atomically.
+    """
+    cursor.execute(f"DROP TABLE IF EXISTS {live} CASCADE")
+    cursor.execute(
+        "SELECT relname, relkind FROM pg_class "
+        "WHERE left(relname, %s) = %s AND relkind IN ('r', 'p', 'i', 'I') "
+        "AND relnamespace = 'public'::regnamespace",
+        (len(staging), staging),
+    )
+    for name, kind in cursor.fetchall():
+        new_name = live + name[len(staging):]
+        statement = "ALTER INDEX" if kind in ("i", "I") else "ALTER TABLE"
+        cursor.execute(f"{statement} {name} RENAME TO {new_name}")
+
+
+def partition_years(file_paths):
+    """
+    Years the given bronze files belong to, from their path
+    (year=YYYY/ or YYYY/ folders, or the window start in the file name).
+    """
+    years = set()
+    for file_path in file_paths:
+        parsed = parse_window_path(file_path)
+        if parsed:
+            years.add(parsed[1].year)
+            continue
+        for part in file_path.split(os.sep):
+            match = YEAR_DIR_PATTERN.match(part)
+            if match:
+                years.add(int(match.group(1)))
+    return years